@@ -1,16 +1,468 @@
 import torch
 import torch.nn as nn
-import torchvision.transforms as transforms
+import numpy as np
 from PIL import Image
+import argparse
+import io
 import os
 import json
-import random
-from typing import Dict, Any, Optional, List
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional, List, Callable, Tuple
 from torchvision import models
 
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.environ.get('MODEL_PATH', 'best_model.pth')
+DEFAULT_CLASS_MAPPING_PATH = os.environ.get('CLASS_MAPPING_PATH', 'class_mapping.json')
+INPUT_SIZE = 224
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+# Reject images whose header claims more pixels than this before decoding them
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', '40000000'))
+
+# Inference backends; everything but eager is checked against eager outputs before use
+BACKENDS = ('eager', 'torchscript', 'compile', 'dynamic_int8', 'static_int8')
+DEFAULT_BACKEND = os.environ.get('MODEL_BACKEND', 'eager')
+# Directory of real sample images, split between int8 calibration and held-out parity checks.
+# Required for static_int8; the other backends check parity on random inputs without it.
+CALIBRATION_DIR = os.environ.get('MODEL_CALIBRATION_DIR')
+CALIBRATION_SAMPLES = int(os.environ.get('MODEL_CALIBRATION_SAMPLES', '16'))
+# Max absolute probability difference and min top-1 agreement allowed versus eager
+PARITY_TOLERANCES = {
+    'torchscript': (1e-4, 1.0),
+    'compile': (1e-3, 1.0),
+    'dynamic_int8': (0.05, 0.95),
+    'static_int8': (0.1, 0.9)
+}
+
+# Detailed recommendations for each disease
+DISEASE_RECOMMENDATIONS: Dict[str, Dict[str, Any]] = {
+    'healthy': {
+        'immediate_actions': [
+            'Continue regular monitoring',
+            'Maintain current care routine'
+        ],
+        'preventive_measures': [
+            'Regular watering schedule',
+            'Proper fertilization',
+            'Adequate spacing between plants'
+        ],
+        'monitoring_frequency': 'Weekly',
+        'risk_level': 'Low'
+    },
+    'early_blight': {
+        'immediate_actions': [
+            'Remove infected leaves immediately',
+            'Improve air circulation',
+            'Apply fungicide containing chlorothalonil or mancozeb'
+        ],
+        'preventive_measures': [
+            'Plant resistant varieties',
+            'Maintain proper spacing',
+            'Avoid overhead watering',
+            'Mulch around plants'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'Medium'
+    },
+    'late_blight': {
+        'immediate_actions': [
+            'Remove and destroy infected plants',
+            'Improve drainage',
+            'Apply copper-based fungicide',
+            'Isolate affected area'
+        ],
+        'preventive_measures': [
+            'Use disease-free seeds',
+            'Implement crop rotation',
+            'Maintain proper spacing',
+            'Monitor weather conditions'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'High'
+    },
+    'leaf_mold': {
+        'immediate_actions': [
+            'Reduce humidity levels',
+            'Improve ventilation',
+            'Remove infected leaves',
+            'Apply appropriate fungicide'
+        ],
+        'preventive_measures': [
+            'Maintain proper spacing',
+            'Use resistant varieties',
+            'Monitor humidity levels',
+            'Regular pruning'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'Medium'
+    },
+    'septoria_leaf_spot': {
+        'immediate_actions': [
+            'Remove infected leaves',
+            'Avoid overhead watering',
+            'Apply fungicide',
+            'Improve air circulation'
+        ],
+        'preventive_measures': [
+            'Use disease-free seeds',
+            'Implement crop rotation',
+            'Maintain proper spacing',
+            'Regular pruning'
+        ],
+        'monitoring_frequency': 'Weekly',
+        'risk_level': 'Medium'
+    },
+    'spider_mites': {
+        'immediate_actions': [
+            'Increase humidity',
+            'Apply insecticidal soap',
+            'Introduce natural predators',
+            'Remove heavily infested leaves'
+        ],
+        'preventive_measures': [
+            'Regular monitoring',
+            'Maintain proper humidity',
+            'Avoid over-fertilization',
+            'Keep plants well-watered'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'Medium'
+    },
+    'target_spot': {
+        'immediate_actions': [
+            'Remove infected leaves',
+            'Improve air circulation',
+            'Apply fungicide',
+            'Reduce leaf wetness'
+        ],
+        'preventive_measures': [
+            'Use resistant varieties',
+            'Maintain proper spacing',
+            'Avoid overhead watering',
+            'Regular pruning'
+        ],
+        'monitoring_frequency': 'Weekly',
+        'risk_level': 'Medium'
+    },
+    'yellow_leaf_curl_virus': {
+        'immediate_actions': [
+            'Remove infected plants',
+            'Control whitefly population',
+            'Use virus-free seeds',
+            'Implement physical barriers'
+        ],
+        'preventive_measures': [
+            'Use resistant varieties',
+            'Monitor whitefly populations',
+            'Implement crop rotation',
+            'Use reflective mulches'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'High'
+    },
+    'mosaic_virus': {
+        'immediate_actions': [
+            'Remove infected plants',
+            'Control aphid population',
+            'Use virus-free seeds',
+            'Implement physical barriers'
+        ],
+        'preventive_measures': [
+            'Use resistant varieties',
+            'Monitor aphid populations',
+            'Implement crop rotation',
+            'Use reflective mulches'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'High'
+    },
+    'powdery_mildew': {
+        'immediate_actions': [
+            'Remove infected leaves',
+            'Improve air circulation',
+            'Apply sulfur-based fungicide',
+            'Reduce humidity'
+        ],
+        'preventive_measures': [
+            'Use resistant varieties',
+            'Maintain proper spacing',
+            'Regular pruning',
+            'Monitor humidity levels'
+        ],
+        'monitoring_frequency': 'Weekly',
+        'risk_level': 'Medium'
+    },
+    'downy_mildew': {
+        'immediate_actions': [
+            'Remove infected leaves',
+            'Improve air circulation',
+            'Apply appropriate fungicide',
+            'Reduce leaf wetness'
+        ],
+        'preventive_measures': [
+            'Use resistant varieties',
+            'Avoid overhead watering',
+            'Maintain proper spacing',
+            'Monitor weather conditions'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'High'
+    },
+    'bacterial_spot': {
+        'immediate_actions': [
+            'Remove infected leaves',
+            'Apply copper-based bactericide',
+            'Improve air circulation',
+            'Reduce leaf wetness'
+        ],
+        'preventive_measures': [
+            'Use disease-free seeds',
+            'Avoid overhead watering',
+            'Maintain proper spacing',
+            'Regular pruning'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'Medium'
+    },
+    'bacterial_wilt': {
+        'immediate_actions': [
+            'Remove infected plants',
+            'Improve drainage',
+            'Apply appropriate bactericide',
+            'Isolate affected area'
+        ],
+        'preventive_measures': [
+            'Use disease-free seeds',
+            'Implement crop rotation',
+            'Maintain proper drainage',
+            'Monitor soil health'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'High'
+    },
+    'fusarium_wilt': {
+        'immediate_actions': [
+            'Remove infected plants',
+            'Improve soil drainage',
+            'Apply appropriate fungicide',
+            'Isolate affected area'
+        ],
+        'preventive_measures': [
+            'Use resistant varieties',
+            'Implement crop rotation',
+            'Maintain proper drainage',
+            'Monitor soil health'
+        ],
+        'monitoring_frequency': 'Daily',
+        'risk_level': 'High'
+    }
+}
+
+
+def load_image(image: Image.Image, size: Tuple[int, int] = (INPUT_SIZE, INPUT_SIZE),
+               max_pixels: int = MAX_IMAGE_PIXELS) -> Image.Image:
+    """Decode an opened (not yet loaded) image straight to an RGB image of `size`.
+
+    JPEGs are decoded in draft mode, which lets libjpeg scale by 1/2, 1/4 or
+    1/8 during decoding, so a 12MP photo never materializes at full
+    resolution. A single cheap resize then brings it to `size`.
+    """
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ValueError(f"Image is too large ({width}x{height}, limit is {max_pixels} pixels)")
+    if size[0] < 1 or size[1] < 1 or size[0] * size[1] > max_pixels:
+        raise ValueError(f"Invalid target size {size[0]}x{size[1]}")
+
+    if image.format == 'JPEG':
+        image.draft('RGB', size)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return image
+
+
+class BatchPreprocessor:
+    """Vectorized uint8 HxWx3 -> normalized float NCHW conversion for whole batches.
+
+    The uint8 -> float conversion and the HWC -> CHW layout change happen in a
+    single copy into a preallocated buffer, followed by one in-place
+    scale-and-shift that folds ToTensor's /255 into Normalize. Buffers are
+    kept per thread and reused, so the returned tensor is only valid until the
+    same thread calls the preprocessor again.
+    """
+
+    def __init__(self, size: int = INPUT_SIZE, mean: Tuple[float, ...] = IMAGENET_MEAN,
+                 std: Tuple[float, ...] = IMAGENET_STD):
+        self.size = size
+        std_tensor = torch.tensor(std).view(1, 3, 1, 1)
+        self._scale = 1.0 / (255.0 * std_tensor)
+        self._shift = torch.tensor(mean).view(1, 3, 1, 1) / std_tensor
+        self._local = threading.local()
+
+    def _buffer(self, batch_size: int) -> torch.Tensor:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = torch.empty((batch_size, 3, self.size, self.size), dtype=torch.float32)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+
+    def __call__(self, arrays: List[np.ndarray]) -> torch.Tensor:
+        out = self._buffer(len(arrays))
+        for index, array in enumerate(arrays):
+            out[index].copy_(torch.from_numpy(array).permute(2, 0, 1))
+        return out.mul_(self._scale).sub_(self._shift)
+
+
+def build_network(num_classes: int) -> nn.Module:
+    """Build the ResNet50 architecture used by train_model.CropDiseaseModel"""
+    network = models.resnet50(weights=None)
+    num_features = network.fc.in_features
+    network.fc = nn.Sequential(
+        nn.Linear(num_features, 512),
+        nn.ReLU(),
+        nn.Dropout(0.5),
+        nn.Linear(512, num_classes)
+    )
+    return network
+
+
+def read_checkpoint(model_path: str, map_location: Any = 'cpu',
+                    mmap: bool = False) -> Tuple[Dict[str, torch.Tensor], Optional[List[str]]]:
+    """Load a best_model.pth checkpoint, returning its state dict and class names by output index.
+
+    train_model.py saves {'state_dict': ..., 'classes': [...]}; older
+    checkpoints are a bare state dict and carry no class names (None).
+    """
+    checkpoint = torch.load(model_path, map_location=map_location, mmap=mmap, weights_only=True)
+    if 'state_dict' in checkpoint and 'classes' in checkpoint:
+        return checkpoint['state_dict'], list(checkpoint['classes'])
+    return checkpoint, None
+
+
+def sample_images(count: int, calibration_dir: Optional[str] = CALIBRATION_DIR) -> List[np.ndarray]:
+    """Up to `count` real images from calibration_dir (searched recursively) as uint8 input arrays"""
+    arrays: List[np.ndarray] = []
+    if calibration_dir and os.path.isdir(calibration_dir):
+        for root, _, names in sorted(os.walk(calibration_dir)):
+            for name in sorted(names):
+                if len(arrays) >= count:
+                    break
+                if name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                    with Image.open(os.path.join(root, name)) as image:
+                        arrays.append(np.array(load_image(image)))
+    return arrays
+
+
+def backend_samples(backend: str, count: int = CALIBRATION_SAMPLES,
+                    calibration_dir: Optional[str] = CALIBRATION_DIR) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Normalized (calibration, parity) batches for building and checking `backend`.
+
+    Real images are split alternately, so the parity check always runs on
+    images the calibration never saw. Without real images only the
+    uncalibrated backends get a fixed-seed random batch; static_int8 raises,
+    since activation ranges taken from noise don't match leaf photos.
+    """
+    arrays = sample_images(2 * count, calibration_dir)
+    if len(arrays) >= 2:
+        preprocessor = BatchPreprocessor()
+        return preprocessor(arrays[0::2]).clone(), preprocessor(arrays[1::2]).clone()
+    if backend == 'static_int8':
+        raise ValueError('static_int8 needs MODEL_CALIBRATION_DIR with at least two real images '
+                         'for calibration and a held-out parity check')
+    generator = torch.Generator().manual_seed(0)
+    inputs = torch.randn(2 * count, 3, INPUT_SIZE, INPUT_SIZE, generator=generator)
+    return inputs[:count], inputs[count:]
+
+
+def quantized_engine() -> str:
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in torch.backends.quantized.supported_engines:
+            return engine
+    raise RuntimeError('No quantized engine is available in this torch build')
+
+
+def build_backend(eager: nn.Module, backend: str, sample: torch.Tensor) -> nn.Module:
+    """Derive an inference network for `backend` from the eager fp32 network"""
+    if backend == 'eager':
+        return eager
+    if backend == 'torchscript':
+        # Trace on the eager network's device (backend samples are built on the CPU)
+        device = next(eager.parameters()).device
+        with torch.inference_mode():
+            return torch.jit.freeze(torch.jit.trace(eager, sample[:1].to(device)))
+    if backend == 'compile':
+        return torch.compile(eager)
+
+    import copy
+    torch.backends.quantized.engine = quantized_engine()
+    if backend == 'dynamic_int8':
+        # Only Linear layers (the fc head) have dynamic int8 kernels; convolutions stay fp32
+        quantized = torch.ao.quantization.quantize_dynamic(copy.deepcopy(eager).cpu(), {nn.Linear}, dtype=torch.qint8)
+    elif backend == 'static_int8':
+        from torchvision.models import quantization as quantizable_models
+        quantized = quantizable_models.resnet50(weights=None, quantize=False)
+        quantized.fc = copy.deepcopy(eager.fc)
+        quantized.load_state_dict(eager.state_dict())
+        quantized.cpu().eval()
+        quantized.fuse_model()
+        quantized.qconfig = torch.ao.quantization.get_default_qconfig(torch.backends.quantized.engine)
+        torch.ao.quantization.prepare(quantized, inplace=True)
+        with torch.inference_mode():
+            quantized(sample)  # calibrate activation ranges
+        torch.ao.quantization.convert(quantized, inplace=True)
+    else:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    with torch.inference_mode():
+        return torch.jit.freeze(torch.jit.trace(quantized, sample[:1]))
+
+
+def check_parity(eager: nn.Module, candidate: nn.Module, backend: str, sample: torch.Tensor) -> Dict[str, Any]:
+    """Compare a backend's probabilities with eager fp32 on the same inputs"""
+    max_diff, min_agreement = PARITY_TOLERANCES.get(backend, (0.0, 1.0))
+    sample = sample.to(next(eager.parameters()).device)
+    with torch.inference_mode():
+        expected = torch.softmax(eager(sample), dim=1).cpu()
+        actual = torch.softmax(candidate(sample), dim=1).cpu()
+    diff = (expected - actual).abs().max().item()
+    agreement = (expected.argmax(dim=1) == actual.argmax(dim=1)).float().mean().item()
+    return {
+        'backend': backend,
+        'samples': sample.shape[0],
+        'max_abs_diff': diff,
+        'top1_agreement': agreement,
+        'max_abs_diff_allowed': max_diff,
+        'top1_agreement_required': min_agreement,
+        'passed': diff <= max_diff and agreement >= min_agreement
+    }
+
+
+def backend_artifact_path(model_path: str, backend: str, version: str) -> str:
+    """Exported artifact location next to the checkpoint, tied to the checkpoint version"""
+    stem, _ = os.path.splitext(model_path)
+    return f"{stem}.{backend}.{version}.pt"
+
+
 class CropDiseaseModel:
-    def __init__(self, model_path: str = 'best_model.pth', class_mapping_path: str = 'class_mapping.json'):
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH, class_mapping_path: str = DEFAULT_CLASS_MAPPING_PATH,
+                 backend: str = DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if backend.endswith('int8'):
+            # Quantized kernels are CPU-only
+            self.device = torch.device('cpu')
+        self.model_path = model_path
+        self.class_mapping_path = class_mapping_path
+        self.backend = backend
+        self.parity: Optional[Dict[str, Any]] = None
         
         # Load class mapping
         try:
@@ -34,242 +486,124 @@ class CropDiseaseModel:
                 'bacterial_wilt': 12,
                 'fusarium_wilt': 13
             }
+        # Replaced by the checkpoint's own class list when it has one (see _load_network)
+        self.class_names = self._class_names(self.class_mapping)
         
-        # Define image transforms
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                              std=[0.229, 0.224, 0.225])
-        ])
+        # Shared by the single and batch predict paths
+        self.preprocessor = BatchPreprocessor(INPUT_SIZE)
         
-        # Define detailed recommendations for each disease
-        self.recommendations = {
-            'healthy': {
-                'immediate_actions': [
-                    'Continue regular monitoring',
-                    'Maintain current care routine'
-                ],
-                'preventive_measures': [
-                    'Regular watering schedule',
-                    'Proper fertilization',
-                    'Adequate spacing between plants'
-                ],
-                'monitoring_frequency': 'Weekly',
-                'risk_level': 'Low'
-            },
-            'early_blight': {
-                'immediate_actions': [
-                    'Remove infected leaves immediately',
-                    'Improve air circulation',
-                    'Apply fungicide containing chlorothalonil or mancozeb'
-                ],
-                'preventive_measures': [
-                    'Plant resistant varieties',
-                    'Maintain proper spacing',
-                    'Avoid overhead watering',
-                    'Mulch around plants'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'Medium'
-            },
-            'late_blight': {
-                'immediate_actions': [
-                    'Remove and destroy infected plants',
-                    'Improve drainage',
-                    'Apply copper-based fungicide',
-                    'Isolate affected area'
-                ],
-                'preventive_measures': [
-                    'Use disease-free seeds',
-                    'Implement crop rotation',
-                    'Maintain proper spacing',
-                    'Monitor weather conditions'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'High'
-            },
-            'leaf_mold': {
-                'immediate_actions': [
-                    'Reduce humidity levels',
-                    'Improve ventilation',
-                    'Remove infected leaves',
-                    'Apply appropriate fungicide'
-                ],
-                'preventive_measures': [
-                    'Maintain proper spacing',
-                    'Use resistant varieties',
-                    'Monitor humidity levels',
-                    'Regular pruning'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'Medium'
-            },
-            'septoria_leaf_spot': {
-                'immediate_actions': [
-                    'Remove infected leaves',
-                    'Avoid overhead watering',
-                    'Apply fungicide',
-                    'Improve air circulation'
-                ],
-                'preventive_measures': [
-                    'Use disease-free seeds',
-                    'Implement crop rotation',
-                    'Maintain proper spacing',
-                    'Regular pruning'
-                ],
-                'monitoring_frequency': 'Weekly',
-                'risk_level': 'Medium'
-            },
-            'spider_mites': {
-                'immediate_actions': [
-                    'Increase humidity',
-                    'Apply insecticidal soap',
-                    'Introduce natural predators',
-                    'Remove heavily infested leaves'
-                ],
-                'preventive_measures': [
-                    'Regular monitoring',
-                    'Maintain proper humidity',
-                    'Avoid over-fertilization',
-                    'Keep plants well-watered'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'Medium'
-            },
-            'target_spot': {
-                'immediate_actions': [
-                    'Remove infected leaves',
-                    'Improve air circulation',
-                    'Apply fungicide',
-                    'Reduce leaf wetness'
-                ],
-                'preventive_measures': [
-                    'Use resistant varieties',
-                    'Maintain proper spacing',
-                    'Avoid overhead watering',
-                    'Regular pruning'
-                ],
-                'monitoring_frequency': 'Weekly',
-                'risk_level': 'Medium'
-            },
-            'yellow_leaf_curl_virus': {
-                'immediate_actions': [
-                    'Remove infected plants',
-                    'Control whitefly population',
-                    'Use virus-free seeds',
-                    'Implement physical barriers'
-                ],
-                'preventive_measures': [
-                    'Use resistant varieties',
-                    'Monitor whitefly populations',
-                    'Implement crop rotation',
-                    'Use reflective mulches'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'High'
-            },
-            'mosaic_virus': {
-                'immediate_actions': [
-                    'Remove infected plants',
-                    'Control aphid population',
-                    'Use virus-free seeds',
-                    'Implement physical barriers'
-                ],
-                'preventive_measures': [
-                    'Use resistant varieties',
-                    'Monitor aphid populations',
-                    'Implement crop rotation',
-                    'Use reflective mulches'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'High'
-            },
-            'powdery_mildew': {
-                'immediate_actions': [
-                    'Remove infected leaves',
-                    'Improve air circulation',
-                    'Apply sulfur-based fungicide',
-                    'Reduce humidity'
-                ],
-                'preventive_measures': [
-                    'Use resistant varieties',
-                    'Maintain proper spacing',
-                    'Regular pruning',
-                    'Monitor humidity levels'
-                ],
-                'monitoring_frequency': 'Weekly',
-                'risk_level': 'Medium'
-            },
-            'downy_mildew': {
-                'immediate_actions': [
-                    'Remove infected leaves',
-                    'Improve air circulation',
-                    'Apply appropriate fungicide',
-                    'Reduce leaf wetness'
-                ],
-                'preventive_measures': [
-                    'Use resistant varieties',
-                    'Avoid overhead watering',
-                    'Maintain proper spacing',
-                    'Monitor weather conditions'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'High'
-            },
-            'bacterial_spot': {
-                'immediate_actions': [
-                    'Remove infected leaves',
-                    'Apply copper-based bactericide',
-                    'Improve air circulation',
-                    'Reduce leaf wetness'
-                ],
-                'preventive_measures': [
-                    'Use disease-free seeds',
-                    'Avoid overhead watering',
-                    'Maintain proper spacing',
-                    'Regular pruning'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'Medium'
-            },
-            'bacterial_wilt': {
-                'immediate_actions': [
-                    'Remove infected plants',
-                    'Improve drainage',
-                    'Apply appropriate bactericide',
-                    'Isolate affected area'
-                ],
-                'preventive_measures': [
-                    'Use disease-free seeds',
-                    'Implement crop rotation',
-                    'Maintain proper drainage',
-                    'Monitor soil health'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'High'
-            },
-            'fusarium_wilt': {
-                'immediate_actions': [
-                    'Remove infected plants',
-                    'Improve soil drainage',
-                    'Apply appropriate fungicide',
-                    'Isolate affected area'
-                ],
-                'preventive_measures': [
-                    'Use resistant varieties',
-                    'Implement crop rotation',
-                    'Maintain proper drainage',
-                    'Monitor soil health'
-                ],
-                'monitoring_frequency': 'Daily',
-                'risk_level': 'High'
-            }
-        }
+        # Recommendations are static, so every instance shares the module-level table
+        self.recommendations = DISEASE_RECOMMENDATIONS
+
+        # Load trained weights if a checkpoint is available
+        self.version = checkpoint_signature(model_path)
+        self.network = self._load_network(model_path)
+
+    @staticmethod
+    def _class_names(class_mapping: Dict[str, Any]) -> List[str]:
+        """Return class names ordered by output index.
+
+        class_mapping.json maps index -> name, the built-in default maps name -> index.
+        """
+        if all(str(key).isdigit() for key in class_mapping):
+            return [class_mapping[key] for key in sorted(class_mapping, key=int)]
+        return [name for name, _ in sorted(class_mapping.items(), key=lambda item: item[1])]
+
+    def _load_network(self, model_path: str) -> Optional[nn.Module]:
+        """Load the trained network for the selected backend, or None to fall back to dummy predictions"""
+        if not os.path.exists(model_path):
+            logger.warning(f"Model checkpoint {model_path} not found, using dummy predictions")
+            return None
+
+        # Output indices follow the training dataset's class order, which the checkpoint records
+        _, classes = read_checkpoint(model_path, mmap=True)
+        if classes is None:
+            logger.warning(f"Checkpoint {model_path} has no class list, "
+                           f"naming outputs from {self.class_mapping_path}")
+        else:
+            self.class_names = classes
+        if self.backend == 'eager':
+            return self._load_eager(model_path)
+
+        # Exported artifacts are built once per checkpoint version and reused
+        artifact_path = backend_artifact_path(model_path, self.backend, self.version)
+        if self.backend != 'compile' and os.path.exists(artifact_path):
+            with open(f"{artifact_path}.json", 'r') as f:
+                self.parity = json.load(f)
+            if self.backend == 'static_int8' and 'calibration_samples' not in self.parity:
+                # Exported before calibration required real images; it may have been calibrated on noise
+                return self.export_backend(model_path)
+            if self.backend.endswith('int8'):
+                torch.backends.quantized.engine = quantized_engine()
+            network = torch.jit.load(artifact_path, map_location=self.device)
+            network.eval()
+            return network
+        return self.export_backend(model_path)
+
+    def export_backend(self, model_path: str) -> nn.Module:
+        """Build the selected backend from the checkpoint, check parity and cache the artifact"""
+        eager = self._load_eager(model_path)
+        try:
+            calibration, held_out = backend_samples(self.backend)
+        except ValueError as e:
+            logger.error(f"Not exporting backend {self.backend}, falling back to eager: {str(e)}")
+            self.backend = 'eager'
+            return eager
+        candidate = build_backend(eager, self.backend, calibration)
+        self.parity = check_parity(eager, candidate, self.backend, held_out)
+        self.parity['calibration_samples'] = calibration.shape[0]
+        if not self.parity['passed']:
+            logger.error(f"Backend {self.backend} failed the parity check against eager, "
+                         f"falling back to eager: {self.parity}")
+            self.backend = 'eager'
+            return eager
+
+        logger.info(f"Backend {self.backend} passed the parity check: {self.parity}")
+        if self.backend != 'compile':
+            # torch.compile has no portable artifact; everything else is cached next to the checkpoint
+            artifact_path = backend_artifact_path(model_path, self.backend, self.version)
+            torch.jit.save(candidate, f"{artifact_path}.tmp")
+            with open(f"{artifact_path}.json.tmp", 'w') as f:
+                json.dump(self.parity, f)
+            os.replace(f"{artifact_path}.json.tmp", f"{artifact_path}.json")
+            os.replace(f"{artifact_path}.tmp", artifact_path)
+        return candidate
+
+    def _load_eager(self, model_path: str) -> nn.Module:
+        """Load the checkpoint into the eager fp32 ResNet50"""
+        state_dict, _ = read_checkpoint(model_path, map_location=self.device)
+        # train_model.CropDiseaseModel wraps the ResNet as `self.model`
+        state_dict = {key[len('model.'):] if key.startswith('model.') else key: value
+                      for key, value in state_dict.items()}
+        network = build_network(len(self.class_names))
+        network.load_state_dict(state_dict)
+        network.to(self.device)
+        network.eval()
+        return network
 
     def preprocess_image(self, image_path: str) -> torch.Tensor:
-        """Dummy preprocessing that just returns a random tensor"""
-        return torch.randn(1, 3, 224, 224)
+        """Load an image from disk and return a normalized 1x3xHxW tensor"""
+        with Image.open(image_path) as image:
+            return self.image_tensor(image)
+
+    def image_array(self, image: Image.Image) -> np.ndarray:
+        """Decode a PIL image into a uint8 HxWx3 array at the model's input size"""
+        # np.array (not asarray) so torch.from_numpy gets a writable buffer
+        return np.array(load_image(image))
+
+    def preprocess_arrays(self, arrays: List[np.ndarray]) -> torch.Tensor:
+        """Normalize a batch of input-size uint8 HxWx3 arrays into an NCHW tensor (reused buffer)"""
+        return self.preprocessor(arrays)
+
+    def image_tensor(self, image: Image.Image) -> torch.Tensor:
+        """Convert a PIL image into a normalized 1x3xHxW tensor"""
+        return self.preprocess_arrays([self.image_array(image)]).clone()
+
+    def input_array(self, array: np.ndarray) -> np.ndarray:
+        """Return a uint8 HxWx3 array at the model's input size, resizing if needed"""
+        if array.shape != (INPUT_SIZE, INPUT_SIZE, 3) or array.dtype != np.uint8:
+            return self.image_array(Image.fromarray(array))
+        return array
 
     def get_recommendations(self, disease: str) -> Dict[str, Any]:
         """Get recommendations for a specific disease"""
@@ -282,30 +616,366 @@ class CropDiseaseModel:
             }
         return self.recommendations[disease]
 
-    def predict(self, image_path: str) -> Dict[str, Any]:
-        """Dummy prediction that returns random but realistic results"""
-        # Generate random probabilities for each class
-        all_classes = list(self.class_mapping.keys())
-        probabilities = {cls: random.random() for cls in all_classes}
-        
-        # Normalize probabilities
-        total = sum(probabilities.values())
-        probabilities = {cls: prob/total for cls, prob in probabilities.items()}
+    def probabilities(self, batch: torch.Tensor) -> torch.Tensor:
+        """Return softmax probabilities (N x num_classes) for a normalized batch"""
+        if self.network is None:
+            # Dummy mode: random but realistic probabilities
+            scores = torch.rand(batch.shape[0], len(self.class_names))
+            return scores / scores.sum(dim=1, keepdim=True)
+
+        with metrics.stage('forward'), torch.inference_mode():
+            outputs = self.network(batch.to(self.device))
+            return torch.softmax(outputs, dim=1).cpu()
+
+    def format_result(self, probabilities: torch.Tensor) -> Dict[str, Any]:
+        """Turn one row of class probabilities into the API result dict"""
+        values = probabilities.tolist()
+        probabilities_by_class = dict(zip(self.class_names, values))
         
         # Get the top prediction
-        predicted_class = max(probabilities.items(), key=lambda x: x[1])[0]
+        predicted_class = self.class_names[max(range(len(values)), key=values.__getitem__)]
         
         # Get recommendations for the predicted disease
         recommendations = self.get_recommendations(predicted_class)
         
         return {
             'predicted_class': predicted_class,
-            'confidence': probabilities[predicted_class],
-            'all_probabilities': probabilities,
+            'confidence': probabilities_by_class[predicted_class],
+            'all_probabilities': probabilities_by_class,
             'recommendations': recommendations
         }
 
+    def predict(self, image_path: str) -> Dict[str, Any]:
+        """Predict the disease shown in an image file"""
+        return self.predict_tensor(self.preprocess_image(image_path))
+
+    def predict_tensor(self, batch: torch.Tensor) -> Dict[str, Any]:
+        """Predict from a normalized 1x3xHxW tensor"""
+        return self.format_result(self.probabilities(batch)[0])
+
+    def predict_image(self, image: Image.Image) -> Dict[str, Any]:
+        """Predict from a decoded PIL image"""
+        return self.predict_batch([self.image_array(image)])[0]
+
+    def predict_array(self, array: Any) -> Dict[str, Any]:
+        """Predict from a uint8 HxWx3 ndarray, or a normalized 3xHxW / 1x3xHxW tensor"""
+        if isinstance(array, torch.Tensor):
+            return self.predict_tensor(array if array.dim() == 4 else array.unsqueeze(0))
+        return self.predict_batch([array])[0]
+
+    def predict_batch(self, arrays: List[np.ndarray], chunk_size: int = 16) -> List[Dict[str, Any]]:
+        """Predict many uint8 HxWx3 arrays with one forward pass per chunk, keeping input order"""
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(arrays), chunk_size):
+            chunk = [self.input_array(array) for array in arrays[start:start + chunk_size]]
+            metrics.BATCH_SIZE.observe(len(chunk), source='predict_batch')
+            probabilities = self.probabilities(self.preprocess_arrays(chunk))
+            results.extend(self.format_result(row) for row in probabilities)
+        return results
+
+    def predict_bytes(self, data: bytes) -> Dict[str, Any]:
+        """Predict from encoded image bytes without touching the filesystem"""
+        with Image.open(io.BytesIO(data)) as image:
+            return self.predict_image(image)
+
+    def warmup(self) -> None:
+        """Run one forward pass so the first request doesn't pay for lazy initialization"""
+        self.probabilities(torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE))
+
+
+def checkpoint_signature(model_path: str) -> str:
+    """Identify a checkpoint by size and mtime, 'untrained' if it doesn't exist"""
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return 'untrained'
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+class ModelRegistry:
+    """Process-wide holder for the loaded CropDiseaseModel.
+
+    Handlers call get() once per request and keep that reference, so reload()
+    can build and warm a replacement off to the side and swap it in atomically
+    while in-flight requests finish on the old instance.
+    """
+
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH, class_mapping_path: str = DEFAULT_CLASS_MAPPING_PATH,
+                 backend: str = DEFAULT_BACKEND):
+        self.model_path = model_path
+        self.class_mapping_path = class_mapping_path
+        self.backend = backend
+        self._model: Optional[CropDiseaseModel] = None
+        self._load_lock = threading.Lock()
+        self._listeners: List[Callable[[CropDiseaseModel], None]] = []
+
+    def _build(self, model_path: str) -> CropDiseaseModel:
+        with metrics.stage('model_build'):
+            model = CropDiseaseModel(model_path, self.class_mapping_path, self.backend)
+            model.warmup()
+        logger.info(f"Loaded model {model_path} (version {model.version}, backend {model.backend}) on {model.device}")
+        return model
+
+    def get(self) -> CropDiseaseModel:
+        """Return the current model, loading it on first use"""
+        model = self._model
+        if model is None:
+            model = self.load()
+        return model
+
+    def load(self) -> CropDiseaseModel:
+        """Load and warm the model if it isn't loaded yet"""
+        with self._load_lock:
+            if self._model is None:
+                self._model = self._build(self.model_path)
+            return self._model
+
+    def reload(self) -> CropDiseaseModel:
+        """Load the checkpoint at model_path again and atomically replace the current model.
+
+        Unlike the first load, a missing checkpoint is an error here: falling
+        back to dummy predictions would silently replace a working model.
+        Listeners run under the load lock, so overlapping reloads notify them
+        in the order the models were swapped in and the last model wins.
+        """
+        with self._load_lock:
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"Model checkpoint {self.model_path} not found")
+            model = self._build(self.model_path)
+            self._model = model
+            for listener in list(self._listeners):
+                listener(model)
+        return model
+
+    def add_reload_listener(self, listener: Callable[[CropDiseaseModel], None]) -> None:
+        """Register a callback invoked with the new model after every reload.
+
+        Listeners must not call load() or reload(), which take the same lock.
+        """
+        self._listeners.append(listener)
+
+
+# Shared by the Flask handlers and their worker threads
+model_registry = ModelRegistry()
+
+
+class BatchingEngine:
+    """Dynamic micro-batching on top of the registry's CropDiseaseModel.
+
+    Callers submit single decoded images; a background worker waits for
+    up to `max_batch_size` requests or `max_wait_ms`, whichever comes first,
+    runs one stacked forward pass and resolves each caller's future.
+    """
+
+    _STOP = object()
+
+    def __init__(self, registry: ModelRegistry = model_registry, max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 pool: Any = None):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+        self.registry = registry
+        # Optional inference_pool.InferencePool; batches are then dispatched without blocking the worker
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: 'queue.Queue[Any]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._last_batch_size = 0
+        self._max_batch_seen = 0
+        self._batch_size_counts: Dict[int, int] = {}
+
+    def start(self) -> None:
+        """Start the background worker if it isn't running"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='batching-engine', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Finish queued requests and stop the worker"""
+        with self._start_lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+            self._thread = None
+
+    def submit(self, image: np.ndarray) -> 'Future[Dict[str, Any]]':
+        """Queue one uint8 HxWx3 image (see CropDiseaseModel.image_array) and return a future result"""
+        if self._thread is None:
+            self.start()
+        future: 'Future[Dict[str, Any]]' = Future()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, image: np.ndarray, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Submit one image and block until its result is ready"""
+        future = self.submit(image)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # A cancelled request is dropped by _run_batch instead of being inferred for nobody
+            future.cancel()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and batch size metrics"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'requests': self._requests,
+                'batches': self._batches,
+                'errors': self._errors,
+                'last_batch_size': self._last_batch_size,
+                'max_batch_size_seen': self._max_batch_seen,
+                'avg_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'batch_size_counts': dict(self._batch_size_counts)
+            }
+
+    def _collect(self, first: Any) -> List[Any]:
+        """Gather queued requests until the batch is full or the wait runs out"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                # Put the sentinel back so the main loop exits after this batch
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            self._run_batch(self._collect(item))
+
+    def _run_batch(self, batch: List[Any]) -> None:
+        # Drop requests whose callers already gave up
+        batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._last_batch_size = len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._batch_size_counts[len(batch)] = self._batch_size_counts.get(len(batch), 0) + 1
+        metrics.BATCH_SIZE.observe(len(batch), source='engine')
+
+        try:
+            model = self.registry.get()
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        # After a reload the old pool still holds the old weights; infer in-process until its replacement is up
+        pool = self.pool
+        if pool is not None and pool.model is model:
+            try:
+                pool.submit([image for image, _ in batch]).add_done_callback(
+                    lambda done: self._resolve_pooled(pool.model, batch, done))
+            except Exception as e:
+                self._fail(batch, e)
+            return
+
+        try:
+            results = model.predict_batch([image for image, _ in batch], chunk_size=len(batch))
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _resolve_pooled(self, model: CropDiseaseModel, batch: List[Any], done: 'Future[Any]') -> None:
+        try:
+            results = [model.format_result(row) for row in done.result()]
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _fail(self, batch: List[Any], error: Exception) -> None:
+        logger.error(f"Batched inference failed: {str(error)}")
+        with self._stats_lock:
+            self._errors += 1
+        for _, future in batch:
+            future.set_exception(error)
+
+
+def get_model() -> CropDiseaseModel:
+    """Return the process-wide model instance"""
+    return model_registry.get()
+
+
 def predict_disease(image_path: str) -> Dict[str, Any]:
-    """Convenience function to create a model and make a prediction"""
-    model = CropDiseaseModel()
-    return model.predict(image_path) 
\ No newline at end of file
+    """Convenience function to make a prediction with the shared model"""
+    return get_model().predict(image_path)
+
+
+def _worker_handler(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Handle one persistent-worker request with the shared model"""
+    from worker_server import request_image_source
+    source = request_image_source(request)
+    if isinstance(source, str):
+        return get_model().predict(source)
+    return get_model().predict_bytes(source.getvalue())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Predict crop disease from an image')
+    parser.add_argument('image_path', nargs='?', help='image to classify (one-shot mode)')
+    parser.add_argument('--serve', action='store_true',
+                        help='keep the model loaded and answer newline-delimited JSON requests')
+    parser.add_argument('--socket', help='Unix socket path to serve on instead of stdin/stdout')
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND, help='inference backend')
+    parser.add_argument('--export', action='store_true',
+                        help='build and cache the --backend artifact next to the checkpoint, then print its parity report')
+    args = parser.parse_args()
+    model_registry.backend = args.backend
+
+    if args.export:
+        logging.basicConfig(level=logging.INFO)
+        if args.backend == 'eager':
+            parser.error('--export needs a non-eager --backend')
+        model = CropDiseaseModel(DEFAULT_MODEL_PATH, DEFAULT_CLASS_MAPPING_PATH, 'eager')
+        if model.network is None:
+            parser.error(f'checkpoint {DEFAULT_MODEL_PATH} not found')
+        model.backend = args.backend
+        model.export_backend(DEFAULT_MODEL_PATH)
+        print(json.dumps(model.parity or {'backend': 'eager'}))
+        return
+
+    if args.serve:
+        from worker_server import serve
+        logging.basicConfig(level=logging.INFO)
+        model_registry.load()
+        serve(_worker_handler, args.socket)
+        return
+
+    if not args.image_path:
+        parser.error('image_path is required unless --serve is given')
+    print(json.dumps(predict_disease(args.image_path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,100 +1,343 @@
-from flask import Flask, request, jsonify # type: ignore
+from flask import Flask, Response, g, request, jsonify, stream_with_context # type: ignore
 from flask_cors import CORS # type: ignore
-from werkzeug.utils import secure_filename
 import os
-from ai_model import predict_disease, CropDiseaseModel
+from cache import TokenCache, ResultCache, PrecomputedResponse
+import metrics
 import logging
-import firebase_admin # type: ignore
-from firebase_admin import credentials, auth # type: ignore
+from contextlib import contextmanager
 from functools import wraps
 import concurrent.futures
-from PIL import Image
+import contextvars
+import multiprocessing
+import threading
+import time
 import io
+import json
 import base64
-import numpy as np
+
+# Heavy modules (torch, torchvision, numpy, PIL via ai_model, and firebase_admin)
+# are imported lazily: /api/health answers as soon as Flask is up, a background
+# thread warms auth and the model, and /api/ready reports when both are usable.
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Firebase Admin
-cred = credentials.Certificate('firebase-credentials.json')
-firebase_admin.initialize_app(cred)
+class StartupReport:
+    """Wall-clock time spent importing and loading each startup component"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, component):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self.errors[component] = str(e)
+            raise
+        finally:
+            with self._lock:
+                self.timings[component] = round((time.perf_counter() - start) * 1000, 2)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'components_ms': dict(self.timings),
+                'errors': dict(self.errors),
+                'uptime_s': round(time.perf_counter() - self.started, 3)
+            }
+
+startup_report = StartupReport()
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+with startup_report.timed('flask app'):
+    app = Flask(__name__)
+    CORS(app)  # Enable CORS for all routes
 
-# Configure upload folder
-UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Micro-batching knobs for /api/predict
+PREDICT_MAX_BATCH_SIZE = int(os.environ.get('PREDICT_MAX_BATCH_SIZE', '16'))
+PREDICT_MAX_WAIT_MS = float(os.environ.get('PREDICT_MAX_WAIT_MS', '5'))
+PREDICT_TIMEOUT_S = float(os.environ.get('PREDICT_TIMEOUT_S', '30'))
+
+# /api/predict/batch: images per forward pass and parallel decode threads
+PREDICT_BATCH_CHUNK_SIZE = int(os.environ.get('PREDICT_BATCH_CHUNK_SIZE', '16'))
+PREDICT_DECODE_WORKERS = int(os.environ.get('PREDICT_DECODE_WORKERS', '4'))
+
+# /api/predict/batch/stream: images decoding or inferring at once, per-image size cap and read size
+PREDICT_STREAM_MAX_IN_FLIGHT = int(os.environ.get('PREDICT_STREAM_MAX_IN_FLIGHT', '8'))
+PREDICT_STREAM_MAX_FILE_BYTES = int(os.environ.get('PREDICT_STREAM_MAX_FILE_BYTES', str(20 * 1024 * 1024)))
+PREDICT_STREAM_READ_BYTES = 64 * 1024
+
+# Cache-Control max-age for the precomputed /api/diseases response
+DISEASES_MAX_AGE = int(os.environ.get('DISEASES_MAX_AGE', '300'))
+
+# Multi-process inference (0 keeps inference in this process)
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '0'))
+INFERENCE_THREADS_PER_WORKER = int(os.environ.get('INFERENCE_THREADS_PER_WORKER', '0')) or None
+
+# Warm auth and the model in a background thread at import time
+WARM_ON_STARTUP = os.environ.get('WARM_ON_STARTUP', '1') != '0'
+
+_firebase_lock = threading.Lock()
+_firebase_auth = None
+
+def firebase_auth():
+    """Import firebase_admin and initialize credentials on first use"""
+    global _firebase_auth
+    if _firebase_auth is None:
+        with _firebase_lock:
+            if _firebase_auth is None:
+                with startup_report.timed('import firebase_admin'):
+                    import firebase_admin # type: ignore
+                    from firebase_admin import credentials, auth # type: ignore
+                with startup_report.timed('firebase init'):
+                    cred = credentials.Certificate('firebase-credentials.json')
+                    firebase_admin.initialize_app(cred)
+                _firebase_auth = auth
+    return _firebase_auth
+
+# Request metrics; stage timings are recorded through metrics.stage() and exposed on /metrics
+REQUESTS = metrics.registry.counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status', ['endpoint', 'method', 'status'])
+REQUEST_SECONDS = metrics.registry.histogram(
+    'http_request_duration_seconds', 'Time until the response headers are ready, by endpoint', ['endpoint'])
+REQUEST_ERRORS = metrics.registry.counter(
+    'request_errors_total', 'Failed requests and per-image failures by endpoint and exception type',
+    ['endpoint', 'type'])
+
+def record_error(error, endpoint=None):
+    REQUEST_ERRORS.inc(endpoint=endpoint or request.endpoint or 'unmatched', type=type(error).__name__)
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.start_request_timings()
+
+@app.after_request
+def finish_request_metrics(response):
+    # Streamed bodies are still being produced here, so they are timed up to their headers
+    total = time.perf_counter() - g.get('request_start', time.perf_counter())
+    endpoint = request.endpoint or 'unmatched'
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    REQUEST_SECONDS.observe(total, endpoint=endpoint)
+    response.headers['Server-Timing'] = metrics.server_timing(metrics.request_timings(), total)
+    return response
+
+@app.teardown_request
+def end_request_metrics(error=None):
+    metrics.end_request_timings()
+
+def verify_firebase_token(token):
+    return firebase_auth().verify_id_token(token)
+
+# Verified ID tokens are reused until their `exp` claim
+token_cache = TokenCache(verify_firebase_token,
+                         max_size=int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', '1024')))
+
+# Prediction results keyed by image bytes, model version and options
+result_cache = ResultCache(max_size=int(os.environ.get('PREDICT_CACHE_SIZE', '1024')),
+                           disk_dir=os.environ.get('PREDICT_CACHE_DIR') or None)
+
+# PIL releases the GIL while decoding, so uploads decode in parallel
+decode_executor = concurrent.futures.ThreadPoolExecutor(max_workers=PREDICT_DECODE_WORKERS,
+                                                        thread_name_prefix='decode')
+
+# Runs per-image decode + inference jobs for streaming batch requests
+stream_executor = concurrent.futures.ThreadPoolExecutor(max_workers=PREDICT_STREAM_MAX_IN_FLIGHT,
+                                                        thread_name_prefix='stream')
+
+_ai_lock = threading.Lock()
+_ai_model = None
+inference_engine = None
+inference_pool = None
+_pool_lock = threading.Lock()
+
+def start_inference_pool(model):
+    """Start a process pool for `model` and retire the previous one (also used as a reload listener).
+
+    The old pool is detached first, so requests infer in-process with `model`
+    while the new pool starts, and stay in-process if `model` can't be pooled.
+    """
+    global inference_pool
+    from inference_pool import InferencePool
+    # Overlapping reloads must not each build a pool and leak one of them
+    with _pool_lock:
+        old_pool = inference_pool
+        inference_pool = None
+        if inference_engine is not None:
+            inference_engine.pool = None
+        if old_pool is not None:
+            old_pool.close()
+
+        if model.network is None:
+            logger.warning("INFERENCE_WORKERS is set but no checkpoint is loaded, inferring in-process")
+            return
+        try:
+            with startup_report.timed('inference pool'):
+                pool = InferencePool(model, INFERENCE_WORKERS, INFERENCE_THREADS_PER_WORKER,
+                                     result_timeout=PREDICT_TIMEOUT_S)
+        except Exception as e:
+            logger.error(f"Failed to start the inference pool, inferring in-process: {str(e)}")
+            return
+        inference_pool = pool
+        if inference_engine is not None:
+            inference_engine.pool = pool
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+def batch_runner(model):
+    """The pool if it serves `model`, else `model` itself (e.g. while a reloaded model's pool starts)"""
+    pool = inference_pool
+    return pool if pool is not None and pool.model is model else model
+
+def ai():
+    """Import ai_model, load and warm the shared model and start the batching engine on first use"""
+    global _ai_model, inference_engine
+    if _ai_model is None:
+        with _ai_lock:
+            if _ai_model is None:
+                with startup_report.timed('import torch'):
+                    import torch # noqa: F401
+                with startup_report.timed('import torchvision'):
+                    import torchvision # noqa: F401
+                with startup_report.timed('import numpy'):
+                    import numpy # noqa: F401
+                with startup_report.timed('import PIL'):
+                    from PIL import Image # noqa: F401
+                with startup_report.timed('import ai_model'):
+                    import ai_model
+                with startup_report.timed('model load'), metrics.stage('model_load'):
+                    ai_model.model_registry.load()
+                ai_model.model_registry.add_reload_listener(result_cache.clear)
+                if INFERENCE_WORKERS > 0:
+                    start_inference_pool(ai_model.model_registry.get())
+                    ai_model.model_registry.add_reload_listener(start_inference_pool)
+                engine = ai_model.BatchingEngine(ai_model.model_registry,
+                                                 max_batch_size=PREDICT_MAX_BATCH_SIZE,
+                                                 max_wait_ms=PREDICT_MAX_WAIT_MS,
+                                                 pool=inference_pool)
+                engine.start()
+                inference_engine = engine
+                _ai_model = ai_model
+    return _ai_model
+
+def readiness():
+    """Which startup components are loaded"""
+    return {
+        'auth': _firebase_auth is not None,
+        'model': _ai_model is not None
+    }
+
+def warm_up():
+    """Load auth and the model in the background so the first request doesn't pay for it"""
+    for name, loader in (('auth', firebase_auth), ('model', ai)):
+        try:
+            loader()
+        except Exception as e:
+            logger.error(f"Failed to load {name}: {str(e)}")
+    logger.info(f"Startup report: {startup_report.as_dict()}")
+
+def start_warm_up():
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+# Inference pool workers re-import this module under spawn; only the server process warms up.
+# `python app.py` decides in the __main__ block, since the reloader's watcher process never serves.
+if WARM_ON_STARTUP and multiprocessing.parent_process() is None and __name__ != '__main__':
+    start_warm_up()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+class AuthError(Exception):
+    """Authentication failure; the message is the client-facing error"""
+
+def verify_auth_header(auth_header):
+    """Return the decoded token for an `Authorization: Bearer ...` header or raise AuthError"""
+    if not auth_header:
+        raise AuthError('No authorization header')
+    
+    try:
+        # Extract token from Bearer header
+        token = auth_header.split('Bearer ')[1]
+        # Verify the token (cached until it expires)
+        with metrics.stage('auth'):
+            return token_cache.verify(token)
+    except Exception as e:
+        logger.error(f"Authentication error: {str(e)}")
+        raise AuthError('Invalid token')
+
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return jsonify({'error': 'No authorization header', 'status': 'error'}), 401
-        
         try:
-            # Extract token from Bearer header
-            token = auth_header.split('Bearer ')[1]
-            # Verify the token
-            decoded_token = auth.verify_id_token(token)
-            request.user = decoded_token
-            return f(*args, **kwargs)
-        except Exception as e:
-            logger.error(f"Authentication error: {str(e)}")
-            return jsonify({'error': 'Invalid token', 'status': 'error'}), 401
+            request.user = verify_auth_header(request.headers.get('Authorization'))
+        except AuthError as e:
+            record_error(e)
+            return jsonify({'error': str(e), 'status': 'error'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+def require_admin(f):
+    """Like require_auth, but the token must also carry the `admin` custom claim"""
+    @wraps(f)
+    @require_auth
+    def decorated(*args, **kwargs):
+        if request.user.get('admin') is not True:
+            record_error(AuthError('Admin privileges required'))
+            return jsonify({'error': 'Admin privileges required', 'status': 'error'}), 403
+        return f(*args, **kwargs)
     return decorated
 
+def decode_image_data(image_data):
+    """Return raw image bytes, decoding base64 / data URL strings if needed"""
+    if isinstance(image_data, str):
+        if image_data.startswith('data:image'):
+            image_data = image_data.split(',')[1]
+        try:
+            with metrics.stage('base64_decode'):
+                image_data = base64.b64decode(image_data)
+        except Exception as e:
+            raise ValueError(f"Image preprocessing failed: {str(e)}")
+    return image_data
+
 def preprocess_image(image_data, options=None):
-    """Preprocess image based on provided options"""
+    """Decode and preprocess an image based on provided options, returning a PIL image"""
     if options is None:
         options = {}
     
     try:
-        # Convert base64 to image if needed
-        if isinstance(image_data, str):
-            if image_data.startswith('data:image'):
-                image_data = image_data.split(',')[1]
-            image_data = base64.b64decode(image_data)
-        
-        # Open image
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Apply preprocessing options
-        if options.get('resize'):
-            width, height = options['resize']
-            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        ai_model = ai()
+        from PIL import Image
+        image_data = decode_image_data(image_data)
         
-        if options.get('normalize'):
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+        with metrics.stage('preprocess'):
+            # Open image (this only parses the header)
+            image = Image.open(io.BytesIO(image_data))
             
-            # Normalize pixel values
-            img_array = np.array(image) / 255.0
-            image = Image.fromarray((img_array * 255).astype(np.uint8))
-        
-        if options.get('enhance'):
-            from PIL import ImageEnhance
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(1.2)
-        
-        # Convert back to bytes
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
+            # Decode at reduced scale and resize once, to the requested size or the model's input size
+            if options.get('resize'):
+                # The model only ever sees INPUT_SIZE x INPUT_SIZE, so larger targets just cost memory
+                width, height = options['resize']
+                target_size = (min(max(int(width), 1), ai_model.INPUT_SIZE),
+                               min(max(int(height), 1), ai_model.INPUT_SIZE))
+            else:
+                target_size = (ai_model.INPUT_SIZE, ai_model.INPUT_SIZE)
+            image = ai_model.load_image(image, target_size)
+            
+            # `normalize` is accepted for compatibility: load_image already yields RGB
+            # and normalization happens in the model's vectorized batch preprocessing
+            
+            if options.get('enhance'):
+                from PIL import ImageEnhance
+                enhancer = ImageEnhance.Contrast(image)
+                image = enhancer.enhance(1.2)
         
-        return img_byte_arr
+        return image
     except Exception as e:
         logger.error(f"Error preprocessing image: {str(e)}")
         raise ValueError(f"Image preprocessing failed: {str(e)}")
@@ -107,20 +350,34 @@ def health_check():
         'message': 'AI Model API is running'
     })
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint: 200 once the model and auth are loaded, 503 until then"""
+    components = readiness()
+    ready = all(components.values())
+    return jsonify({
+        'status': 'ready' if ready else 'starting',
+        'components': components,
+        'startup': startup_report.as_dict()
+    }), 200 if ready else 503
+
 @app.route('/api/predict', methods=['POST'])
 @require_auth
 def predict():
     """Endpoint for disease prediction"""
     try:
+        # Multipart uploads carry no JSON body
+        body = request.get_json(silent=True) or {}
+        
         # Check if file was uploaded
-        if 'file' not in request.files and 'image' not in request.json:
+        if 'file' not in request.files and 'image' not in body:
             return jsonify({
                 'error': 'No image data provided',
                 'status': 'error'
             }), 400
 
         # Get preprocessing options
-        options = request.json.get('options', {}) if 'image' in request.json else {}
+        options = body.get('options', {}) if 'image' in body else {}
         
         # Handle file upload
         if 'file' in request.files:
@@ -138,34 +395,101 @@ def predict():
             image_data = file.read()
         else:
             # Handle base64 image
-            image_data = request.json['image']
+            image_data = decode_image_data(body['image'])
         
-        # Preprocess image
-        processed_image = preprocess_image(image_data, options)
-        
-        # Save temporarily for prediction
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], 'temp.jpg')
-        with open(temp_path, 'wb') as f:
-            f.write(processed_image)
-        
-        # Get prediction
-        result = predict_disease(temp_path)
-        
-        # Clean up
-        os.remove(temp_path)
+        # Re-uploads and client retries are answered from the result cache
+        model = ai().model_registry.get()
+        with metrics.stage('cache_lookup'):
+            cache_key = result_cache.key(image_data, model.version, options)
+            result = result_cache.get(cache_key)
+        if result is None:
+            # Preprocess image in memory
+            image = preprocess_image(image_data, options)
+            
+            # Get prediction through the micro-batching engine
+            with metrics.stage('inference'):
+                result = inference_engine.predict(model.image_array(image), timeout=PREDICT_TIMEOUT_S)
+            with metrics.stage('cache_write'):
+                result_cache.set(cache_key, result)
         
-        return jsonify({
-            'status': 'success',
-            'data': result
-        })
+        with metrics.stage('serialize'):
+            return jsonify({
+                'status': 'success',
+                'data': result
+            })
 
     except Exception as e:
+        record_error(e)
         logger.error(f"Error processing request: {str(e)}")
         return jsonify({
             'error': str(e),
             'status': 'error'
         }), 500
 
+@app.route('/api/predict/stats', methods=['GET'])
+@require_auth
+def predict_stats():
+    """Endpoint exposing micro-batching queue depth and batch size metrics"""
+    ai()
+    stats = inference_engine.stats()
+    if inference_pool is not None:
+        stats['pool'] = inference_pool.stats()
+    return jsonify({
+        'status': 'success',
+        'data': stats
+    })
+
+@app.route('/api/predict/cache', methods=['GET'])
+@require_auth
+def predict_cache_stats():
+    """Endpoint exposing prediction result cache hit rate"""
+    return jsonify({
+        'status': 'success',
+        'data': result_cache.stats()
+    })
+
+def collect_service_metrics():
+    """Scrape-time cache, micro-batching and pool gauges for /metrics"""
+    results = result_cache.stats()
+    tokens = token_cache.stats()
+    yield ('result_cache_lookups_total', 'counter', 'Prediction result cache lookups by outcome', [
+        ({'result': 'memory_hit'}, results['memory_hits']),
+        ({'result': 'disk_hit'}, results['disk_hits']),
+        ({'result': 'miss'}, results['misses'])
+    ])
+    yield ('auth_token_cache_lookups_total', 'counter', 'Verified token cache lookups by outcome', [
+        ({'result': 'hit'}, tokens['hits']),
+        ({'result': 'miss'}, tokens['misses'])
+    ])
+    yield ('cache_entries', 'gauge', 'Entries held in memory by each cache', [
+        ({'cache': 'result'}, results['size']),
+        ({'cache': 'auth_token'}, tokens['size'])
+    ])
+    # Before the model is loaded there is no engine or pool to report on
+    engine = inference_engine
+    if engine is not None:
+        stats = engine.stats()
+        yield ('inference_queue_depth', 'gauge', 'Requests waiting for the micro-batching engine',
+               [({}, stats['queue_depth'])])
+        yield ('inference_engine_batches_total', 'counter', 'Micro-batches run by the engine',
+               [({}, stats['batches'])])
+        yield ('inference_engine_errors_total', 'counter', 'Micro-batches that failed',
+               [({}, stats['errors'])])
+    pool = inference_pool
+    if pool is not None:
+        stats = pool.stats()
+        yield ('inference_pool_alive_workers', 'gauge', 'Live inference worker processes',
+               [({}, stats['alive_workers'])])
+        yield ('inference_pool_in_flight', 'gauge', 'Batches submitted to the inference pool and not yet answered',
+               [({}, stats['in_flight'])])
+
+metrics.registry.add_collector(collect_service_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (unauthenticated, like /api/health)"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/predict/batch', methods=['POST'])
 @require_auth
 def predict_batch():
@@ -184,77 +508,302 @@ def predict_batch():
                 'status': 'error'
             }), 400
 
-        # Process files in parallel
+        chunk_size = request.form.get('chunk_size', PREDICT_BATCH_CHUNK_SIZE, type=int)
+        if chunk_size < 1:
+            return jsonify({
+                'error': 'chunk_size must be a positive integer',
+                'status': 'error'
+            }), 400
+
+        model = ai().model_registry.get()
+        uploads = [(file.filename, file.read()) for file in files]
+
+        # Answer repeated images from the result cache, decode the rest in parallel
+        decode_start = time.perf_counter()
         results = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            future_to_file = {
-                executor.submit(process_single_file, file): file.filename
-                for file in files
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_file):
-                filename = future_to_file[future]
-                try:
-                    result = future.result()
-                    results.append({
-                        'filename': filename,
-                        'result': result
-                    })
-                except Exception as e:
-                    results.append({
-                        'filename': filename,
-                        'error': str(e)
-                    })
+        futures = []
+        for filename, data in uploads:
+            # Checked before the cache, which would otherwise answer for a disallowed file with known bytes
+            if not allowed_file(filename):
+                record_error(ValueError('File type not allowed'))
+                results.append({'filename': filename, 'error': 'File type not allowed'})
+                futures.append(None)
+                continue
+            with metrics.stage('cache_lookup'):
+                cache_key = result_cache.key(data, model.version)
+                cached = result_cache.get(cache_key)
+            if cached is not None:
+                results.append({'filename': filename, 'result': cached})
+                futures.append(None)
+            else:
+                results.append({'filename': filename, 'cache_key': cache_key})
+                # Run in a copy of this context so the decode stages reach the request's Server-Timing
+                futures.append(decode_executor.submit(contextvars.copy_context().run,
+                                                      decode_single_file, model, filename, data))
+        pending = []
+        arrays = []
+        for entry, future in zip(results, futures):
+            if future is None:
+                continue
+            try:
+                arrays.append(future.result())
+                pending.append(entry)
+            except Exception as e:
+                record_error(e)
+                del entry['cache_key']
+                entry['error'] = str(e)
+        decode_ms = (time.perf_counter() - decode_start) * 1000
 
-        return jsonify({
-            'status': 'success',
-            'data': results
-        })
+        # Run stacked forward passes over the decoded images
+        inference_start = time.perf_counter()
+        runner = batch_runner(model)
+        with metrics.stage('inference'):
+            batch_results = runner.predict_batch(arrays, chunk_size)
+        with metrics.stage('cache_write'):
+            for entry, result in zip(pending, batch_results):
+                result_cache.set(entry.pop('cache_key'), result)
+                entry['result'] = result
+        inference_ms = (time.perf_counter() - inference_start) * 1000
+
+        with metrics.stage('serialize'):
+            return jsonify({
+                'status': 'success',
+                'data': results,
+                'timings': {
+                    'decode_ms': round(decode_ms, 2),
+                    'inference_ms': round(inference_ms, 2),
+                    'images': len(arrays),
+                    'chunk_size': chunk_size
+                }
+            })
 
     except Exception as e:
+        record_error(e)
         logger.error(f"Error processing batch request: {str(e)}")
         return jsonify({
             'error': str(e),
             'status': 'error'
         }), 500
 
-def process_single_file(file):
-    """Process a single file for prediction"""
-    if not allowed_file(file.filename):
+def decode_single_file(model, filename, data):
+    """Decode a single upload into a model-ready uint8 array"""
+    if not allowed_file(filename):
         raise ValueError('File type not allowed')
     
-    # Save file temporarily
-    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
-    file.save(temp_path)
-    
+    # Decode straight from the uploaded bytes
+    image = preprocess_image(data)
+    return model.image_array(image)
+
+def predict_stream_item(filename, data):
+    """Decode and predict one streamed upload, returning its NDJSON record"""
+    start = time.perf_counter()
+    entry = {'filename': filename}
     try:
-        # Get prediction
-        result = predict_disease(temp_path)
-        return result
-    finally:
-        # Clean up
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        if not allowed_file(filename):
+            raise ValueError('File type not allowed')
+        model = ai().model_registry.get()
+        with metrics.stage('cache_lookup'):
+            cache_key = result_cache.key(data, model.version)
+            result = result_cache.get(cache_key)
+        if result is None:
+            array = decode_single_file(model, filename, data)
+            with metrics.stage('inference'):
+                result = inference_engine.predict(array, timeout=PREDICT_TIMEOUT_S)
+            with metrics.stage('cache_write'):
+                result_cache.set(cache_key, result)
+        entry['result'] = result
+    except Exception as e:
+        # Runs on a stream worker thread, outside the request context
+        record_error(e, 'predict_batch_stream')
+        entry['error'] = str(e)
+    entry['timing_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return entry
+
+class MultipartFileParser:
+    """Incremental multipart/form-data parser yielding the uploaded files.
+
+    Feed it the request body chunk by chunk (b'' at the end); each feed()
+    returns the (filename, bytes) file parts completed so far. Parts larger
+    than PREDICT_STREAM_MAX_FILE_BYTES come back as (filename, None) after
+    their data has been discarded. Shared by the Flask and ASGI stream endpoints.
+    """
+
+    def __init__(self, boundary):
+        from werkzeug.sansio.multipart import MultipartDecoder
+        self.decoder = MultipartDecoder(boundary)
+        self.done = False
+        self._filename = None
+        self._chunks = []
+        self._size = 0
+
+    def feed(self, data):
+        from werkzeug.sansio.multipart import NeedData, File, Data, Epilogue
+        self.decoder.receive_data(data or None)
+        files = []
+        while not self.done:
+            event = self.decoder.next_event()
+            if isinstance(event, NeedData):
+                break
+            elif isinstance(event, File):
+                self._filename, self._chunks, self._size = event.filename, [], 0
+            elif isinstance(event, Data):
+                if self._filename is None:
+                    # Plain form field, not an image
+                    continue
+                self._size += len(event.data)
+                if self._size <= PREDICT_STREAM_MAX_FILE_BYTES:
+                    self._chunks.append(event.data)
+                else:
+                    self._chunks = []
+                if not event.more_data:
+                    too_large = self._size > PREDICT_STREAM_MAX_FILE_BYTES
+                    files.append((self._filename, None if too_large else b''.join(self._chunks)))
+                    self._filename = None
+            elif isinstance(event, Epilogue):
+                self.done = True
+            else:
+                self._filename = None
+        return files
+
+def iter_multipart_files(stream, boundary):
+    """Yield (filename, bytes) for each file part, reading the request body incrementally"""
+    parser = MultipartFileParser(boundary)
+    while not parser.done:
+        data = stream.read(PREDICT_STREAM_READ_BYTES)
+        yield from parser.feed(data)
+        if not data:
+            return
+
+@app.route('/api/predict/batch/stream', methods=['POST'])
+@require_auth
+def predict_batch_stream():
+    """Streaming batch prediction: one NDJSON line per image as soon as it finishes"""
+    from werkzeug.http import parse_options_header
+    mimetype, content_options = parse_options_header(request.headers.get('Content-Type', ''))
+    boundary = content_options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        return jsonify({
+            'error': 'Expected a multipart/form-data upload',
+            'status': 'error'
+        }), 400
+    stream = request.stream
+
+    def generate():
+        start = time.perf_counter()
+        # The headers (and Server-Timing) are sent before any image is processed, so the
+        # stages timed on the stream threads are reported in the closing line instead
+        metrics.start_request_timings()
+        in_flight = set()
+        counts = {'images': 0, 'errors': 0}
+
+        def finished(futures):
+            for future in futures:
+                entry = future.result()
+                counts['errors'] += 'error' in entry
+                yield json.dumps(entry) + '\n'
+
+        try:
+            for filename, data in iter_multipart_files(stream, boundary.encode('latin-1')):
+                counts['images'] += 1
+                if data is None:
+                    counts['errors'] += 1
+                    yield json.dumps({'filename': filename, 'error': 'File too large'}) + '\n'
+                    continue
+                # Memory stays bounded by the images in flight, not the batch size
+                while len(in_flight) >= PREDICT_STREAM_MAX_IN_FLIGHT:
+                    done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    yield from finished(done)
+                in_flight.add(stream_executor.submit(contextvars.copy_context().run, predict_stream_item, filename, data))
+                done = {future for future in in_flight if future.done()}
+                in_flight -= done
+                yield from finished(done)
+            while in_flight:
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                yield from finished(done)
+        except Exception as e:
+            record_error(e, 'predict_batch_stream')
+            logger.error(f"Error streaming batch request: {str(e)}")
+            yield json.dumps({'error': str(e), 'status': 'error'}) + '\n'
+            return
+        yield json.dumps({
+            'status': 'success',
+            'done': True,
+            'images': counts['images'],
+            'errors': counts['errors'],
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+            'stages_ms': {name: round(elapsed * 1000, 2)
+                          for name, elapsed in metrics.stage_durations(metrics.request_timings()).items()}
+        }) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+_diseases_lock = threading.Lock()
+_diseases_response = None
+
+def diseases_response():
+    """The /api/diseases payload, serialized and compressed once per model / recommendations table"""
+    global _diseases_response
+    model = ai().model_registry.get()
+    key = (model.version, id(model.recommendations))
+    cached = _diseases_response
+    if cached is None or cached[0] != key:
+        with _diseases_lock:
+            cached = _diseases_response
+            if cached is None or cached[0] != key:
+                response = PrecomputedResponse({
+                    'status': 'success',
+                    'data': {
+                        'diseases': list(model.recommendations.keys()),
+                        'recommendations': model.recommendations
+                    }
+                }, max_age=DISEASES_MAX_AGE)
+                cached = _diseases_response = (key, response)
+    return cached[1]
 
 @app.route('/api/diseases', methods=['GET'])
 @require_auth
 def get_diseases():
     """Endpoint to get list of supported diseases and their details"""
     try:
-        model = CropDiseaseModel()
+        precomputed = diseases_response()
+        if precomputed.not_modified(request.headers.get('If-None-Match')):
+            # The 304 carries the ETag of the encoding this client would have received
+            _, headers = precomputed.select(request.headers.get('Accept-Encoding'))
+            return Response(status=304, headers=headers)
+        body, headers = precomputed.select(request.headers.get('Accept-Encoding'))
+        return Response(body, status=200, headers=headers, mimetype='application/json')
+    except Exception as e:
+        record_error(e)
+        logger.error(f"Error getting diseases list: {str(e)}")
+        return jsonify({
+            'error': str(e),
+            'status': 'error'
+        }), 500
+
+@app.route('/api/model/reload', methods=['POST'])
+@require_admin
+def reload_model():
+    """Admin endpoint to hot-reload the configured checkpoint (MODEL_PATH) without dropping requests"""
+    try:
+        model = ai().model_registry.reload()
         return jsonify({
             'status': 'success',
             'data': {
-                'diseases': list(model.recommendations.keys()),
-                'recommendations': model.recommendations
+                'model_path': model.model_path,
+                'version': model.version
             }
         })
     except Exception as e:
-        logger.error(f"Error getting diseases list: {str(e)}")
+        record_error(e)
+        logger.error(f"Error reloading model: {str(e)}")
         return jsonify({
             'error': str(e),
             'status': 'error'
         }), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    debug = True
+    # With the reloader, only the child it spawns (WERKZEUG_RUN_MAIN set) handles requests
+    if WARM_ON_STARTUP and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_warm_up()
+    app.run(host='0.0.0.0', port=5000, debug=debug) 
\ No newline at end of file
@@ -1,9 +1,5 @@
 import { NextResponse } from "next/server"
-import { spawn } from "child_process"
-import { writeFile } from "fs/promises"
-import { join } from "path"
-import { tmpdir } from "os"
-import { unlink } from "fs/promises"
+import { getWorkerPool } from "@/lib/python-worker-pool"
 
 export async function POST(request: Request) {
   try {
@@ -17,48 +13,12 @@ export async function POST(request: Request) {
       )
     }
 
-    // Create a temporary file to store the uploaded image
+    // Send the image to a persistent Python worker instead of spawning one per request
     const bytes = await image.arrayBuffer()
-    const buffer = Buffer.from(bytes)
-    const tempPath = join(tmpdir(), `disease-${Date.now()}.jpg`)
-    await writeFile(tempPath, buffer)
-
-    // Run the Python script
-    const result = await new Promise((resolve, reject) => {
-      const pythonProcess = spawn("python", [
-        "scripts/detect_disease.py",
-        tempPath
-      ])
-
-      let output = ""
-
-      pythonProcess.stdout.on("data", (data) => {
-        output += data.toString()
-      })
-
-      pythonProcess.stderr.on("data", (data) => {
-        console.error(`Python Error: ${data}`)
-        reject(new Error("Failed to process image"))
-      })
-
-      pythonProcess.on("close", (code) => {
-        if (code !== 0) {
-          reject(new Error(`Python process exited with code ${code}`))
-          return
-        }
-
-        try {
-          const result = JSON.parse(output)
-          resolve(result)
-        } catch (error) {
-          reject(new Error("Failed to parse Python output"))
-        }
-      })
+    const result = await getWorkerPool("scripts/detect_disease.py").request({
+      image_base64: Buffer.from(bytes).toString("base64")
     })
 
-    // Clean up the temporary file
-    await unlink(tempPath)
-
     return NextResponse.json(result)
   } catch (error) {
     console.error("Disease detection error:", error)
@@ -1,9 +1,5 @@
 import { NextResponse } from 'next/server'
-import { writeFile } from 'fs/promises'
-import { join } from 'path'
-import { v4 as uuidv4 } from 'uuid'
-import { spawn } from 'child_process'
-import { unlink } from 'fs/promises'
+import { getWorkerPool } from '@/lib/python-worker-pool'
 
 export async function POST(request: Request) {
   try {
@@ -33,45 +29,11 @@ export async function POST(request: Request) {
       )
     }
 
-    // Create uploads directory if it doesn't exist
-    const uploadsDir = join(process.cwd(), 'uploads')
-    const fileName = `${uuidv4()}-${file.name}`
-    const filePath = join(uploadsDir, fileName)
-    
-    // Save the file
-    await writeFile(filePath, Buffer.from(await file.arrayBuffer()))
-
-    // Run Python script for prediction
-    const prediction = await new Promise((resolve, reject) => {
-      const pythonProcess = spawn('python', ['ai_model.py', filePath])
-      
-      let result = ''
-      let error = ''
-
-      pythonProcess.stdout.on('data', (data) => {
-        result += data.toString()
-      })
-
-      pythonProcess.stderr.on('data', (data) => {
-        error += data.toString()
-      })
-
-      pythonProcess.on('close', (code) => {
-        if (code !== 0) {
-          reject(new Error(`Python process exited with code ${code}: ${error}`))
-        } else {
-          try {
-            resolve(JSON.parse(result))
-          } catch (e) {
-            reject(new Error('Failed to parse prediction result'))
-          }
-        }
-      })
+    // Send the image to a persistent Python worker that keeps the model loaded
+    const prediction = await getWorkerPool('ai_model.py').request({
+      image_base64: Buffer.from(await file.arrayBuffer()).toString('base64')
     })
 
-    // Clean up the uploaded file
-    await unlink(filePath)
-
     return NextResponse.json({ prediction })
   } catch (error) {
     console.error('Error processing prediction:', error)
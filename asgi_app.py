@@ -0,0 +1,468 @@
+"""Async (ASGI) server for the prediction API.
+
+Serves the same endpoints as the Flask app in app.py, with the same auth
+and error responses, request metrics and Server-Timing header, and shares
+its model registry, caches and batching engine. Request bodies are awaited,
+so slow uploads don't hold a worker thread, and decode and inference run on
+executors. At most
+ASGI_MAX_IN_FLIGHT requests are admitted at once; beyond that the server
+answers 503 with Retry-After instead of letting latency pile up.
+
+Run with: uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import contextvars
+import json
+import os
+import time
+
+from fastapi import FastAPI, Request  # type: ignore
+from fastapi.middleware.cors import CORSMiddleware  # type: ignore
+from fastapi.responses import JSONResponse, Response, StreamingResponse  # type: ignore
+from starlette.requests import ClientDisconnect  # type: ignore
+
+import app as service
+import metrics
+
+# Requests admitted at once (uploads being received, decoded or inferred)
+ASGI_MAX_IN_FLIGHT = int(os.environ.get('ASGI_MAX_IN_FLIGHT', '64'))
+ASGI_RETRY_AFTER_S = int(os.environ.get('ASGI_RETRY_AFTER_S', '1'))
+
+logger = service.logger
+
+app = FastAPI(title='AI Model API')
+app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+
+
+def error_response(message, status_code):
+    return JSONResponse({'error': message, 'status': 'error'}, status_code=status_code)
+
+
+class Backpressure:
+    """Admission control: at most `limit` requests in flight, the rest get 503"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        # The event loop is single-threaded, so plain counters are safe here
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+backpressure = Backpressure(ASGI_MAX_IN_FLIGHT)
+
+
+@app.middleware('http')
+async def limit_in_flight(request: Request, call_next):
+    # Health and readiness probes must keep answering under load
+    if request.url.path in ('/api/health', '/api/ready'):
+        return await call_next(request)
+    if not backpressure.try_acquire():
+        response = error_response('Server is overloaded, please retry later', 503)
+        response.headers['Retry-After'] = str(ASGI_RETRY_AFTER_S)
+        return response
+    try:
+        return await call_next(request)
+    finally:
+        backpressure.release()
+
+
+# Registered after limit_in_flight so it wraps it and also counts 503s
+@app.middleware('http')
+async def request_metrics(request: Request, call_next):
+    """Same request counters, latency histogram and Server-Timing header as the Flask app"""
+    start = time.perf_counter()
+    metrics.start_request_timings()
+    try:
+        response = await call_next(request)
+        total = time.perf_counter() - start
+        endpoint = endpoint_name(request)
+        service.REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+        service.REQUEST_SECONDS.observe(total, endpoint=endpoint)
+        response.headers['Server-Timing'] = metrics.server_timing(metrics.request_timings(), total)
+        return response
+    finally:
+        metrics.end_request_timings()
+
+
+def endpoint_name(request: Request):
+    # Endpoint functions share their Flask counterparts' names, so the label values match
+    endpoint = request.scope.get('endpoint')
+    return getattr(endpoint, '__name__', 'unmatched')
+
+
+async def run_blocking(func, *args, executor=None):
+    # Run in a copy of this context so stages timed on the executor reach the request's Server-Timing
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, context.run, func, *args)
+
+
+async def authenticate(request: Request, admin=False):
+    """Verify the bearer token like app.require_auth (or app.require_admin); returns an error response or None"""
+    try:
+        request.state.user = await run_blocking(service.verify_auth_header, request.headers.get('Authorization'))
+    except service.AuthError as e:
+        service.record_error(e, endpoint_name(request))
+        return error_response(str(e), 401)
+    if admin and request.state.user.get('admin') is not True:
+        service.record_error(service.AuthError('Admin privileges required'), endpoint_name(request))
+        return error_response('Admin privileges required', 403)
+    return None
+
+
+class RequestBodyStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator reads the request body itself.
+
+    StreamingResponse listens for the client disconnecting on receive(),
+    which would swallow the request body chunks the iterator is waiting
+    for; here a disconnect surfaces as a failed send instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+
+def decode_upload(model, image_data, options):
+    """Preprocess one image into a model-ready uint8 array (runs on the decode executor)"""
+    return model.image_array(service.preprocess_image(image_data, options))
+
+
+@app.get('/api/health')
+async def health_check():
+    """Health check endpoint"""
+    return {
+        'status': 'healthy',
+        'message': 'AI Model API is running'
+    }
+
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    """Prometheus scrape endpoint, shared with the Flask app's registry"""
+    return Response(service.metrics.registry.render(), media_type='text/plain; version=0.0.4')
+
+
+@app.get('/api/ready')
+async def readiness_check():
+    """Readiness endpoint: 200 once the model and auth are loaded, 503 until then"""
+    components = service.readiness()
+    ready = all(components.values())
+    return JSONResponse({
+        'status': 'ready' if ready else 'starting',
+        'components': components,
+        'startup': service.startup_report.as_dict()
+    }, status_code=200 if ready else 503)
+
+
+@app.post('/api/predict')
+async def predict(request: Request):
+    """Endpoint for disease prediction"""
+    auth_error = await authenticate(request)
+    if auth_error is not None:
+        return auth_error
+
+    try:
+        file = None
+        body = {}
+        if request.headers.get('content-type', '').startswith('multipart/form-data'):
+            form = await request.form()
+            file = form.get('file')
+            if not hasattr(file, 'read'):
+                file = None
+        else:
+            try:
+                body = await request.json()
+            except ValueError:
+                body = {}
+            if not isinstance(body, dict):
+                body = {}
+
+        # Check if file was uploaded
+        if file is None and 'image' not in body:
+            return error_response('No image data provided', 400)
+
+        # Get preprocessing options
+        options = body.get('options', {}) if 'image' in body else {}
+
+        # Handle file upload
+        if file is not None:
+            if not getattr(file, 'filename', ''):
+                return error_response('No file selected', 400)
+            if not service.allowed_file(file.filename):
+                return error_response('File type not allowed. Please upload a PNG, JPG, or JPEG image.', 400)
+            image_data = await file.read()
+        else:
+            # Handle base64 image
+            image_data = service.decode_image_data(body['image'])
+
+        ai_model = await run_blocking(service.ai)
+        model = ai_model.model_registry.get()
+        with metrics.stage('cache_lookup'):
+            cache_key = service.result_cache.key(image_data, model.version, options)
+            result = service.result_cache.get(cache_key)
+        if result is None:
+            array = await run_blocking(decode_upload, model, image_data, options, executor=service.decode_executor)
+            # The batching engine resolves a concurrent future; no thread waits on it
+            with metrics.stage('inference'):
+                future = service.inference_engine.submit(array)
+                result = await asyncio.wait_for(asyncio.wrap_future(future), service.PREDICT_TIMEOUT_S)
+            with metrics.stage('cache_write'):
+                service.result_cache.set(cache_key, result)
+
+        return {
+            'status': 'success',
+            'data': result
+        }
+
+    except Exception as e:
+        service.record_error(e, 'predict')
+        logger.error(f"Error processing request: {str(e)}")
+        return error_response(str(e), 500)
+
+
+@app.get('/api/predict/stats')
+async def predict_stats(request: Request):
+    """Endpoint exposing micro-batching queue depth and batch size metrics"""
+    auth_error = await authenticate(request)
+    if auth_error is not None:
+        return auth_error
+
+    await run_blocking(service.ai)
+    stats = service.inference_engine.stats()
+    if service.inference_pool is not None:
+        stats['pool'] = service.inference_pool.stats()
+    return {
+        'status': 'success',
+        'data': stats
+    }
+
+
+@app.get('/api/predict/cache')
+async def predict_cache_stats(request: Request):
+    """Endpoint exposing prediction result cache hit rate"""
+    auth_error = await authenticate(request)
+    if auth_error is not None:
+        return auth_error
+
+    return {
+        'status': 'success',
+        'data': service.result_cache.stats()
+    }
+
+
+@app.post('/api/predict/batch')
+async def predict_batch(request: Request):
+    """Endpoint for batch disease prediction"""
+    auth_error = await authenticate(request)
+    if auth_error is not None:
+        return auth_error
+
+    try:
+        form = await request.form()
+        if 'files' not in form:
+            return error_response('No files uploaded', 400)
+
+        files = [item for item in form.getlist('files') if hasattr(item, 'read')]
+        if not files:
+            return error_response('No files selected', 400)
+
+        try:
+            chunk_size = int(form.get('chunk_size', service.PREDICT_BATCH_CHUNK_SIZE))
+        except (TypeError, ValueError):
+            chunk_size = service.PREDICT_BATCH_CHUNK_SIZE
+        if chunk_size < 1:
+            return error_response('chunk_size must be a positive integer', 400)
+
+        ai_model = await run_blocking(service.ai)
+        model = ai_model.model_registry.get()
+        uploads = [(file.filename, await file.read()) for file in files]
+
+        # Answer repeated images from the result cache, decode the rest in parallel
+        decode_start = time.perf_counter()
+        results = []
+        jobs = []
+        for filename, data in uploads:
+            # Checked before the cache, which would otherwise answer for a disallowed file with known bytes
+            if not service.allowed_file(filename):
+                service.record_error(ValueError('File type not allowed'), 'predict_batch')
+                results.append({'filename': filename, 'error': 'File type not allowed'})
+                continue
+            with metrics.stage('cache_lookup'):
+                cache_key = service.result_cache.key(data, model.version)
+                cached = service.result_cache.get(cache_key)
+            if cached is not None:
+                results.append({'filename': filename, 'result': cached})
+            else:
+                entry = {'filename': filename, 'cache_key': cache_key}
+                results.append(entry)
+                jobs.append((entry, run_blocking(service.decode_single_file, model, filename, data,
+                                                 executor=service.decode_executor)))
+        decoded = await asyncio.gather(*(job for _, job in jobs), return_exceptions=True)
+        pending = []
+        arrays = []
+        for (entry, _), array in zip(jobs, decoded):
+            if isinstance(array, Exception):
+                service.record_error(array, 'predict_batch')
+                del entry['cache_key']
+                entry['error'] = str(array)
+            else:
+                arrays.append(array)
+                pending.append(entry)
+        decode_ms = (time.perf_counter() - decode_start) * 1000
+
+        # Run stacked forward passes over the decoded images
+        inference_start = time.perf_counter()
+        runner = service.batch_runner(model)
+        with metrics.stage('inference'):
+            predictions = await run_blocking(runner.predict_batch, arrays, chunk_size)
+        with metrics.stage('cache_write'):
+            for entry, result in zip(pending, predictions):
+                service.result_cache.set(entry.pop('cache_key'), result)
+                entry['result'] = result
+        inference_ms = (time.perf_counter() - inference_start) * 1000
+
+        return {
+            'status': 'success',
+            'data': results,
+            'timings': {
+                'decode_ms': round(decode_ms, 2),
+                'inference_ms': round(inference_ms, 2),
+                'images': len(arrays),
+                'chunk_size': chunk_size
+            }
+        }
+
+    except Exception as e:
+        service.record_error(e, 'predict_batch')
+        logger.error(f"Error processing batch request: {str(e)}")
+        return error_response(str(e), 500)
+
+
+@app.post('/api/predict/batch/stream')
+async def predict_batch_stream(request: Request):
+    """Streaming batch prediction: one NDJSON line per image as soon as it finishes"""
+    auth_error = await authenticate(request)
+    if auth_error is not None:
+        return auth_error
+
+    from werkzeug.http import parse_options_header  # type: ignore
+    mimetype, content_options = parse_options_header(request.headers.get('content-type', ''))
+    boundary = content_options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        return error_response('Expected a multipart/form-data upload', 400)
+
+    async def generate():
+        start = time.perf_counter()
+        # The headers (and Server-Timing) are sent before any image is processed, so the
+        # stages timed on the stream threads are reported in the closing line instead
+        metrics.start_request_timings()
+        parser = service.MultipartFileParser(boundary.encode('latin-1'))
+        in_flight = set()
+        counts = {'images': 0, 'errors': 0}
+
+        def finished(tasks):
+            for task in tasks:
+                entry = task.result()
+                counts['errors'] += 'error' in entry
+                yield json.dumps(entry) + '\n'
+
+        try:
+            async for chunk in request.stream():
+                for filename, data in parser.feed(chunk):
+                    counts['images'] += 1
+                    if data is None:
+                        counts['errors'] += 1
+                        yield json.dumps({'filename': filename, 'error': 'File too large'}) + '\n'
+                        continue
+                    # Memory stays bounded by the images in flight, not the batch size
+                    while len(in_flight) >= service.PREDICT_STREAM_MAX_IN_FLIGHT:
+                        done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                        for line in finished(done):
+                            yield line
+                    in_flight.add(asyncio.ensure_future(run_blocking(
+                        service.predict_stream_item, filename, data, executor=service.stream_executor)))
+                done = {task for task in in_flight if task.done()}
+                in_flight -= done
+                for line in finished(done):
+                    yield line
+            while in_flight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for line in finished(done):
+                    yield line
+        except Exception as e:
+            service.record_error(e, 'predict_batch_stream')
+            logger.error(f"Error streaming batch request: {str(e)}")
+            yield json.dumps({'error': str(e), 'status': 'error'}) + '\n'
+            return
+        yield json.dumps({
+            'status': 'success',
+            'done': True,
+            'images': counts['images'],
+            'errors': counts['errors'],
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+            'stages_ms': {name: round(elapsed * 1000, 2)
+                          for name, elapsed in metrics.stage_durations(metrics.request_timings()).items()}
+        }) + '\n'
+
+    return RequestBodyStreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+@app.get('/api/diseases')
+async def get_diseases(request: Request):
+    """Endpoint to get list of supported diseases and their details"""
+    auth_error = await authenticate(request)
+    if auth_error is not None:
+        return auth_error
+
+    try:
+        precomputed = await run_blocking(service.diseases_response)
+        if precomputed.not_modified(request.headers.get('if-none-match')):
+            # The 304 carries the ETag of the encoding this client would have received
+            _, headers = precomputed.select(request.headers.get('accept-encoding'))
+            return Response(status_code=304, headers=headers)
+        body, headers = precomputed.select(request.headers.get('accept-encoding'))
+        return Response(body, status_code=200, headers=headers, media_type='application/json')
+    except Exception as e:
+        service.record_error(e, 'get_diseases')
+        logger.error(f"Error getting diseases list: {str(e)}")
+        return error_response(str(e), 500)
+
+
+@app.post('/api/model/reload')
+async def reload_model(request: Request):
+    """Admin endpoint to hot-reload the configured checkpoint (MODEL_PATH) without dropping requests"""
+    auth_error = await authenticate(request, admin=True)
+    if auth_error is not None:
+        return auth_error
+
+    try:
+        ai_model = await run_blocking(service.ai)
+        model = await run_blocking(ai_model.model_registry.reload)
+        return {
+            'status': 'success',
+            'data': {
+                'model_path': model.model_path,
+                'version': model.version
+            }
+        }
+    except Exception as e:
+        service.record_error(e, 'reload_model')
+        logger.error(f"Error reloading model: {str(e)}")
+        return error_response(str(e), 500)
+
+
+if __name__ == '__main__':
+    import uvicorn  # type: ignore
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', '8000')))
@@ -0,0 +1,295 @@
+"""Offline benchmarks for the inference and API hot paths.
+
+Covers app.preprocess_image over image sizes and options,
+CropDiseaseModel.predict (single image) and predict_batch, and the
+/api/predict and /api/predict/batch endpoints through the Flask test
+client at several concurrency levels. Firebase auth is stubbed through the
+token cache's verifier, and unless MODEL_PATH is set a randomly initialized
+checkpoint is written to a temporary directory, so nothing touches the
+network. Every request uses a distinct image, so the result cache never
+answers for the model.
+
+Each case reports p50/p95/p99 latency, throughput and peak RSS (the
+process high-water mark, reset before each case where Linux allows it).
+
+    python benchmarks/bench.py                               # run everything
+    python benchmarks/bench.py --quick --only api            # subset, fewer iterations
+    python benchmarks/bench.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench.py --compare benchmarks/baseline.json --tolerance 0.15
+
+--compare exits with status 1 when a case's p50/p95 latency or peak RSS
+grew, or its throughput dropped, by more than the tolerance. Baselines are
+only meaningful on the machine (and settings) that recorded them.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PREPROCESS_SIZES = [(320, 240), (1024, 768), (3000, 2000)]
+PREPROCESS_OPTIONS = {
+    'default': {},
+    # Below the model's 224px input size; larger targets are clamped and would match 'default'
+    'resize': {'resize': [160, 160]},
+    'enhance': {'enhance': True}
+}
+BATCH_SIZES = [8, 32]
+CONCURRENCY = [1, 4, 16]
+BATCH_ENDPOINT_FILES = 8
+
+
+def configure_environment(workdir):
+    """Offline settings for app.py; must run before it is imported"""
+    os.environ.setdefault('WARM_ON_STARTUP', '0')
+    os.environ.setdefault('INFERENCE_WORKERS', '0')
+    os.environ.setdefault('CLASS_MAPPING_PATH', os.path.join(ROOT, 'class_mapping.json'))
+    if 'MODEL_PATH' not in os.environ:
+        # ai_model reads MODEL_PATH at import, so set it before importing
+        model_path = os.path.join(workdir, 'bench_model.pth')
+        os.environ['MODEL_PATH'] = model_path
+        import torch
+        from ai_model import build_network
+        with open(os.environ['CLASS_MAPPING_PATH'], 'r') as f:
+            num_classes = len(json.load(f))
+        torch.manual_seed(0)
+        torch.save(build_network(num_classes).state_dict(), model_path)
+
+
+def jpeg_images(count, size, seed=0):
+    """Distinct JPEG-encoded images (noise over a gradient, so they compress like photos)"""
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    width, height = size
+    gradient = np.linspace(0, 200, width, dtype=np.float32)[None, :, None]
+    images = []
+    for _ in range(count):
+        pixels = gradient + rng.integers(0, 55, (height, width, 3)).astype(np.float32)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels.astype(np.uint8)).save(buffer, 'JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def peak_rss_reset():
+    # Writing 5 to clear_refs resets VmHWM on Linux; elsewhere the peak is for the whole run
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(name, operation, payloads, concurrency=1, warmup=2, items_per_call=1):
+    """Run operation over payloads with `concurrency` threads and summarize the latencies"""
+    for payload in payloads[:warmup]:
+        operation(payload)
+    payloads = payloads[warmup:]
+
+    def timed(payload):
+        start = time.perf_counter()
+        operation(payload)
+        return time.perf_counter() - start
+
+    peak_rss_reset()
+    start = time.perf_counter()
+    if concurrency == 1:
+        latencies = [timed(payload) for payload in payloads]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed, payloads))
+    wall = time.perf_counter() - start
+
+    latencies_ms = np.asarray(latencies) * 1000
+    result = {
+        'name': name,
+        'iterations': len(latencies),
+        'concurrency': concurrency,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'mean_ms': float(latencies_ms.mean()),
+        'throughput': len(latencies) * items_per_call / wall,
+        'peak_rss_mb': peak_rss_mb()
+    }
+    print(format_row(result), flush=True)
+    return result
+
+
+def format_row(result):
+    return (f"{result['name']:<40} p50 {result['p50_ms']:9.2f}ms  p95 {result['p95_ms']:9.2f}ms  "
+            f"p99 {result['p99_ms']:9.2f}ms  {result['throughput']:9.1f}/s  rss {result['peak_rss_mb']:8.1f}MB")
+
+
+def bench_preprocess(app, scale):
+    results = []
+    for size in PREPROCESS_SIZES:
+        images = jpeg_images(max(4, 40 // scale), size)
+        for label, options in PREPROCESS_OPTIONS.items():
+            results.append(measure(f'preprocess/{size[0]}x{size[1]}/{label}',
+                                   lambda data, options=options: app.preprocess_image(data, options), images))
+    return results
+
+
+def bench_model(app, workdir, scale):
+    model = app.ai().model_registry.get()
+    results = []
+
+    # predict() takes a path, like the CLI and worker callers
+    paths = []
+    for index, data in enumerate(jpeg_images(max(4, 40 // scale), (640, 480), seed=1)):
+        path = os.path.join(workdir, f'predict-{index}.jpg')
+        with open(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    results.append(measure('model/predict', model.predict, paths))
+
+    for batch_size in BATCH_SIZES:
+        images = jpeg_images(batch_size, (640, 480), seed=batch_size)
+        arrays = [model.image_array(app.preprocess_image(data)) for data in images]
+        repeats = max(3, 10 // scale)
+        results.append(measure(f'model/predict_batch/{batch_size}', model.predict_batch, [arrays] * repeats,
+                               warmup=1, items_per_call=batch_size))
+    return results
+
+
+def bench_api(app, scale):
+    clients = threading.local()
+    headers = {'Authorization': 'Bearer benchmark'}
+
+    def client():
+        if not hasattr(clients, 'client'):
+            clients.client = app.app.test_client()
+        return clients.client
+
+    def check(response):
+        if response.status_code != 200:
+            raise RuntimeError(f'{response.status_code}: {response.get_data(as_text=True)[:200]}')
+
+    def predict_file(data):
+        check(client().post('/api/predict', headers=headers,
+                            data={'file': (io.BytesIO(data), 'leaf.jpg')}, content_type='multipart/form-data'))
+
+    def predict_batch(files):
+        check(client().post('/api/predict/batch', headers=headers,
+                            data={'files': [(io.BytesIO(data), f'leaf-{index}.jpg') for index, data in enumerate(files)]},
+                            content_type='multipart/form-data'))
+
+    results = []
+    seed = 100
+    for concurrency in CONCURRENCY:
+        count = max(8, 64 // scale, 2 * concurrency)
+        seed += 1
+        images = jpeg_images(count + 2, (640, 480), seed=seed)
+        results.append(measure(f'api/predict/c{concurrency}', predict_file, images, concurrency=concurrency))
+    for concurrency in CONCURRENCY[:2]:
+        count = max(4, 16 // scale, 2 * concurrency)
+        seed += 1
+        images = jpeg_images((count + 1) * BATCH_ENDPOINT_FILES, (640, 480), seed=seed)
+        batches = [images[i:i + BATCH_ENDPOINT_FILES] for i in range(0, len(images), BATCH_ENDPOINT_FILES)]
+        results.append(measure(f'api/predict_batch/{BATCH_ENDPOINT_FILES}/c{concurrency}', predict_batch, batches,
+                               concurrency=concurrency, warmup=1, items_per_call=BATCH_ENDPOINT_FILES))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print deltas against a baseline; returns the names of regressed cases"""
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    print(f"\nComparison against baseline (tolerance {tolerance:.0%}):")
+    for result in results:
+        base = previous.get(result['name'])
+        if base is None:
+            print(f"{result['name']:<40} (not in baseline)")
+            continue
+        changes = {
+            'p50': result['p50_ms'] / base['p50_ms'] - 1,
+            'p95': result['p95_ms'] / base['p95_ms'] - 1,
+            'rss': result['peak_rss_mb'] / base['peak_rss_mb'] - 1,
+            'throughput': result['throughput'] / base['throughput'] - 1
+        }
+        # Latency and memory regress upwards, throughput downwards
+        failed = [metric for metric, change in changes.items()
+                  if (-change if metric == 'throughput' else change) > tolerance]
+        deltas = '  '.join(f'{metric} {change:+.1%}' for metric, change in changes.items())
+        print(f"{result['name']:<40} {deltas}  {'REGRESSION: ' + ', '.join(failed) if failed else 'ok'}")
+        if failed:
+            regressions.append(result['name'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the inference and API hot paths offline')
+    parser.add_argument('--only', nargs='+', choices=['preprocess', 'model', 'api'],
+                        help='Run only these groups (default: all)')
+    parser.add_argument('--quick', action='store_true', help='Fewer iterations, for a smoke run')
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--save-baseline', help='Write the results as a baseline file')
+    parser.add_argument('--compare', help='Baseline file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative regression')
+    args = parser.parse_args()
+
+    groups = args.only or ['preprocess', 'model', 'api']
+    scale = 4 if args.quick else 1
+    with tempfile.TemporaryDirectory(prefix='crop-bench-') as workdir:
+        configure_environment(workdir)
+        import app
+
+        # Offline auth: every bearer token verifies as the benchmark user
+        app.token_cache.verifier = lambda token: {'uid': 'benchmark', 'exp': time.time() + 3600}
+        app.ai()
+
+        results = []
+        if 'preprocess' in groups:
+            results.extend(bench_preprocess(app, scale))
+        if 'model' in groups:
+            results.extend(bench_model(app, workdir, scale))
+        if 'api' in groups:
+            results.extend(bench_api(app, scale))
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'cpu_count': os.cpu_count(),
+        'quick': args.quick,
+        'results': results
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=4)
+            print(f'Results written to {path}')
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
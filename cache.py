@@ -0,0 +1,275 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional: br bodies are only offered when installed
+    brotli = None
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU mapping with optional per-entry expiry"""
+
+    def __init__(self, max_size: int = 1024, clock: Callable[[], float] = time.time):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.max_size = max_size
+        self._clock = clock
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, Optional[float]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _firebase_verifier(token: str) -> Dict[str, Any]:
+    from firebase_admin import auth  # type: ignore
+    return auth.verify_id_token(token)
+
+
+class TokenCache:
+    """Cache of verified ID tokens, keyed by token hash and expiring at the `exp` claim.
+
+    `verifier` takes the raw token and returns its decoded claims or raises;
+    it defaults to firebase_admin.auth.verify_id_token and can be swapped for
+    a local stand-in issuer when testing offline.
+    """
+
+    def __init__(self, verifier: Optional[Callable[[str], Dict[str, Any]]] = None, max_size: int = 1024,
+                 clock: Callable[[], float] = time.time):
+        self.verifier = verifier or _firebase_verifier
+        self._clock = clock
+        self._cache = LRUCache(max_size, clock)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        # Never keep raw bearer tokens around as dictionary keys
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the decoded claims for a token, verifying it only on a cache miss"""
+        key = self._key(token)
+        decoded = self._cache.get(key)
+        if decoded is not None:
+            with self._stats_lock:
+                self.hits += 1
+            return dict(decoded)
+
+        with self._stats_lock:
+            self.misses += 1
+        decoded = self.verifier(token)
+        expires_at = decoded.get('exp')
+        if isinstance(expires_at, (int, float)) and expires_at > self._clock():
+            self._cache.set(key, dict(decoded), expires_at=float(expires_at))
+        return decoded
+
+    def invalidate(self, token: str) -> None:
+        """Forget a token, e.g. after the user signs out or is revoked"""
+        self._cache.pop(self._key(token))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'max_size': self._cache.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+class ResultCache:
+    """Content-addressed cache of prediction results.
+
+    Keys hash the raw image bytes together with the model version and the
+    preprocessing options. Results live in a size-bounded in-memory LRU tier
+    and, when `disk_dir` is set, in an on-disk tier of JSON files that
+    survives restarts. clear() drops both tiers and is hooked to model reloads.
+    """
+
+    def __init__(self, max_size: int = 1024, disk_dir: Optional[str] = None):
+        self._memory = LRUCache(max_size)
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data: bytes, model_version: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Build the cache key for an image, model version and preprocessing options"""
+        digest = hashlib.sha256(data)
+        digest.update(b'\0' + model_version.encode('utf-8'))
+        digest.update(b'\0' + json.dumps(options or {}, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir or '', f'{key}.json')
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result, promoting disk hits into memory"""
+        result = self._memory.get(key)
+        if result is not None:
+            with self._stats_lock:
+                self.memory_hits += 1
+            return result
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'r') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = None
+            if result is not None:
+                self._memory.set(key, result)
+                with self._stats_lock:
+                    self.disk_hits += 1
+                return result
+
+        with self._stats_lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, result: Dict[str, Any]) -> None:
+        self._memory.set(key, result)
+        if self.disk_dir:
+            # Write then rename so readers never see a partial file
+            path = self._disk_path(key)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(result, f)
+                os.replace(tmp_path, path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def clear(self, *_args: Any) -> None:
+        """Drop every cached result (accepts and ignores a reload listener's model argument)"""
+        self._memory.clear()
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except OSError:
+                        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'size': len(self._memory),
+                'max_size': self._memory.max_size,
+                'disk_dir': self.disk_dir,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0
+            }
+
+
+def choose_encoding(accept_encoding: Optional[str], available: Tuple[str, ...]) -> Optional[str]:
+    """Pick the first of `available` that an Accept-Encoding header allows (q > 0)"""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in available:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+class PrecomputedResponse:
+    """A JSON payload serialized once, with precompressed bodies and a strong ETag per content-coding"""
+
+    def __init__(self, payload: Any, max_age: int = 300):
+        self.body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.cache_control = f'private, max-age={max_age}'
+        self.encoded = {'gzip': gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(self.body)
+        # Each encoded body is a different representation, so it needs its own strong validator
+        self.etags = {encoding: f'"{digest}-{encoding}"' for encoding in self.encoded}
+        self.etags[None] = self.etag
+
+    def not_modified(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header already names this representation"""
+        if not if_none_match:
+            return False
+        tags = {tag.strip() for tag in if_none_match.split(',')}
+        if '*' in tags:
+            return True
+        # Weak comparison, as RFC 9110 requires for If-None-Match; any encoding's tag names the same content
+        return any(etag in tags or f'W/{etag}' in tags for etag in self.etags.values())
+
+    def select(self, accept_encoding: Optional[str]) -> Tuple[bytes, Dict[str, str]]:
+        """Return the body and headers for a request's Accept-Encoding"""
+        encoding = choose_encoding(accept_encoding, tuple(name for name in ('br', 'gzip') if name in self.encoded))
+        headers = {
+            'ETag': self.etags[encoding],
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding, Authorization'
+        }
+        if encoding is None:
+            return self.body, headers
+        headers['Content-Encoding'] = encoding
+        return self.encoded[encoding], headers
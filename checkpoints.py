@@ -0,0 +1,152 @@
+"""Asynchronous, atomic training checkpoints.
+
+A checkpoint holds everything needed to continue a run: model, optimizer and
+loss-scaler state, the number of completed epochs, the best validation
+accuracy so far and the Python/NumPy/torch RNG states. The training loop
+only pays for copying the state to host memory; serialization and the
+write happen on a background thread, into a temporary file that is renamed
+into place, so a crash never leaves a truncated checkpoint behind.
+"""
+import glob
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATTERN = re.compile(r'checkpoint-epoch(\d+)\.pt$')
+
+
+def snapshot(obj: Any) -> Any:
+    """Deep copy of a (nested) state with every tensor cloned to CPU memory"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+
+def rng_state() -> Dict[str, Any]:
+    # NumPy's state is stored as plain lists so checkpoints load with weights_only=True
+    name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    state = {
+        'python': random.getstate(),
+        'numpy': [name, keys.tolist(), position, has_gauss, cached_gaussian],
+        'torch': torch.get_rng_state()
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: Dict[str, Any]) -> None:
+    version, internal, gauss = state['python']
+    random.setstate((version, tuple(internal), gauss))
+    name, keys, position, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, np.asarray(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    return torch.load(path, map_location='cpu', weights_only=True)
+
+
+class AsyncCheckpointer:
+    """Writes checkpoints on a background thread and keeps the newest `keep` of them.
+
+    At most one write is queued behind the one in progress; a further save
+    waits for the queue, so a slow disk bounds host memory instead of
+    letting snapshots pile up. A failed write is re-raised by the next
+    save() or wait().
+    """
+
+    def __init__(self, directory: str = 'checkpoints', keep: int = 3):
+        if keep < 1:
+            raise ValueError('keep must be at least 1')
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        self._queue: 'queue.Queue[Optional[tuple]]' = queue.Queue(maxsize=1)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+        self._thread.start()
+
+    def path_for(self, epoch: int) -> str:
+        return os.path.join(self.directory, f'checkpoint-epoch{epoch:04d}.pt')
+
+    def latest(self) -> Optional[str]:
+        """Path of the newest checkpoint in the directory, if any"""
+        paths = self._checkpoints()
+        return paths[-1] if paths else None
+
+    def _checkpoints(self):
+        paths = [path for path in glob.glob(os.path.join(self.directory, 'checkpoint-epoch*.pt'))
+                 if CHECKPOINT_PATTERN.search(path)]
+        return sorted(paths, key=lambda path: int(CHECKPOINT_PATTERN.search(path).group(1)))
+
+    def save(self, state: Dict[str, Any], path: str, prune: bool = True) -> None:
+        """Snapshot `state` now and write it to `path` in the background"""
+        self._raise_error()
+        self._queue.put((snapshot(state), path, prune))
+
+    def save_checkpoint(self, state: Dict[str, Any], epoch: int) -> None:
+        self.save(state, self.path_for(epoch))
+
+    def wait(self) -> None:
+        """Block until every queued write has finished"""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        self.wait()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('Writing a checkpoint failed') from error
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                state, path, prune = job
+                self._write(state, path)
+                if prune:
+                    self._prune()
+            except BaseException as e:
+                logger.error(f"Failed to write checkpoint: {e}")
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, state: Dict[str, Any], path: str) -> None:
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _prune(self) -> None:
+        for path in self._checkpoints()[:-self.keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
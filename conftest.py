@@ -0,0 +1,4 @@
+import os
+
+# Importing app.py must not start loading Firebase and the model in the background
+os.environ.setdefault('WARM_ON_STARTUP', '0')
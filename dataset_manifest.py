@@ -0,0 +1,162 @@
+"""Persistent index of an image-folder dataset split (one subdirectory per class).
+
+The manifest records every image's relative path, label, file size, mtime
+and dimensions, so training can start without listing and opening every file
+on (possibly network) storage. It is stored as `manifest.json` inside the
+split directory, in a columnar layout that loads quickly for large splits:
+
+    {"version": 1, "classes": [...], "directories": {class: mtime_ns},
+     "files": {"path": [...], "label": [...], "size": [...],
+               "mtime_ns": [...], "width": [...], "height": [...]}}
+
+A manifest is stale when the set of class directories or any class
+directory's mtime differs from what was recorded; adding, removing or renaming
+images updates the directory mtime. build_manifest() updates an existing
+manifest incrementally, only re-reading image headers for new or changed files.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+COLUMNS = ('path', 'label', 'size', 'mtime_ns', 'width', 'height')
+
+
+def manifest_path(root_dir: str) -> str:
+    return os.path.join(root_dir, MANIFEST_NAME)
+
+
+def is_image_file(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def image_dimensions(path: str) -> Tuple[int, int]:
+    """(width, height) from the image header, without decoding pixels"""
+    with Image.open(path) as image:
+        return image.size
+
+
+def class_directories(root_dir: str) -> Dict[str, int]:
+    """Class name -> directory mtime_ns for every subdirectory of the split"""
+    with os.scandir(root_dir) as entries:
+        return {entry.name: entry.stat().st_mtime_ns for entry in entries if entry.is_dir()}
+
+
+def load_manifest(root_dir: str) -> Optional[Dict[str, Any]]:
+    """Read a split's manifest, or None if it is missing, unreadable or from another version"""
+    try:
+        with open(manifest_path(root_dir), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def is_stale(manifest: Dict[str, Any], root_dir: str) -> bool:
+    """Whether classes were added or removed, or any class directory changed since the manifest was built"""
+    return class_directories(root_dir) != manifest.get('directories')
+
+
+def manifest_digest(manifest: Dict[str, Any]) -> str:
+    """Fingerprint of a manifest's classes and file list, for artifacts derived from it"""
+    files = manifest['files']
+    digest = hashlib.sha256(json.dumps(manifest['classes']).encode('utf-8'))
+    for column in ('path', 'label', 'size', 'mtime_ns'):
+        digest.update(json.dumps(files[column]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def manifest_rows(manifest: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Relative path -> row dict for every file in a manifest"""
+    files = manifest['files']
+    rows = (dict(zip(COLUMNS, values)) for values in zip(*(files[column] for column in COLUMNS)))
+    return {row['path']: row for row in rows}
+
+
+def scan_class(root_dir: str, cls: str, label: int, previous: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Index one class directory, reusing rows whose size and mtime are unchanged"""
+    rows = []
+    with os.scandir(os.path.join(root_dir, cls)) as entries:
+        for entry in entries:
+            if not entry.is_file() or not is_image_file(entry.name):
+                continue
+            stat = entry.stat()
+            path = f'{cls}/{entry.name}'
+            row = previous.get(path)
+            if row is None or row['size'] != stat.st_size or row['mtime_ns'] != stat.st_mtime_ns:
+                try:
+                    width, height = image_dimensions(entry.path)
+                except OSError:
+                    # Unreadable or truncated files are left out of the index
+                    continue
+                row = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                       'width': width, 'height': height}
+            rows.append(dict(row, label=label))
+    rows.sort(key=lambda row: row['path'])
+    return rows
+
+
+def build_manifest(root_dir: str, full: bool = True, save: bool = True) -> Dict[str, Any]:
+    """Build or incrementally update a split's manifest and write it next to the images.
+
+    With full=False, class directories whose mtime matches the existing
+    manifest are taken as-is without listing them, which is the cheap refresh
+    used at training time; full=True stats every file, so in-place edits that
+    don't touch the directory mtime are picked up as well.
+    """
+    previous = load_manifest(root_dir)
+    previous_rows = manifest_rows(previous) if previous else {}
+    previous_dirs = previous.get('directories', {}) if previous else {}
+    previous_by_class: Dict[str, List[Dict[str, Any]]] = {}
+    for path, row in previous_rows.items():
+        previous_by_class.setdefault(path.split('/', 1)[0], []).append(row)
+
+    directories = class_directories(root_dir)
+    classes = sorted(directories)
+    rows: List[Dict[str, Any]] = []
+    for label, cls in enumerate(classes):
+        if not full and previous_dirs.get(cls) == directories[cls]:
+            unchanged = sorted(previous_by_class.get(cls, []), key=lambda row: row['path'])
+            rows.extend(dict(row, label=label) for row in unchanged)
+        else:
+            rows.extend(scan_class(root_dir, cls, label, previous_rows))
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'classes': classes,
+        'directories': directories,
+        'files': {column: [row[column] for row in rows] for column in COLUMNS}
+    }
+    if save:
+        save_manifest(manifest, root_dir)
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Any], root_dir: str) -> None:
+    # Write then rename so a concurrent reader never sees a partial manifest
+    path = manifest_path(root_dir)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def ensure_manifest(root_dir: str) -> Dict[str, Any]:
+    """Load a split's manifest, refreshing the changed class directories if it is missing or stale"""
+    manifest = load_manifest(root_dir)
+    if manifest is not None and not is_stale(manifest, root_dir):
+        return manifest
+    manifest = build_manifest(root_dir, full=False, save=False)
+    try:
+        save_manifest(manifest, root_dir)
+    except OSError:
+        # Read-only dataset: the in-memory index still serves this run
+        pass
+    return manifest
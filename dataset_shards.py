@@ -0,0 +1,111 @@
+"""Pre-decoded, memory-mapped training shards.
+
+Each split is packed once into fixed-size uint8 images so training reads
+pixels straight from the page cache instead of decoding JPEGs every epoch:
+
+    data/shards/<split>/images.npy   N x size x size x 3 uint8 (HWC, RGB)
+    data/shards/<split>/labels.npy   N int64
+    data/shards/<split>/shards.json  classes, size and the source manifest digest
+
+Both arrays are plain .npy files, so np.load(..., mmap_mode=...) maps them
+without copying, and every DataLoader worker shares the same cached pages.
+The images are resized to size x size like the Resize((224, 224)) the
+training transform used (aspect ratio is not preserved).
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from dataset_manifest import ensure_manifest, manifest_digest
+
+SHARD_ROOT = 'data/shards'
+SHARD_SIZE = 256
+IMAGES_NAME = 'images.npy'
+LABELS_NAME = 'labels.npy'
+META_NAME = 'shards.json'
+
+
+def shard_dir(split: str, root: str = SHARD_ROOT) -> str:
+    return os.path.join(root, split)
+
+
+def load_shard_meta(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, META_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def shards_current(directory: str, manifest: Dict[str, Any], size: int = SHARD_SIZE) -> bool:
+    """Whether the shards in `directory` were packed from this manifest at this size"""
+    meta = load_shard_meta(directory)
+    return (meta is not None and meta.get('size') == size
+            and meta.get('manifest_digest') == manifest_digest(manifest)
+            and os.path.exists(os.path.join(directory, IMAGES_NAME)))
+
+
+def decode_image(path: str, size: int) -> np.ndarray:
+    """Decode one image to a size x size x 3 uint8 array"""
+    with Image.open(path) as image:
+        # JPEG draft mode lets libjpeg downscale by 1/2, 1/4 or 1/8 while decoding
+        if image.format == 'JPEG':
+            image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        return np.asarray(image.resize((size, size), Image.BILINEAR, reducing_gap=2.0))
+
+
+def _pack_chunk(images_path: str, paths: List[str], start: int, size: int) -> int:
+    # Each worker writes its own rows of the shared memmap in place
+    images = np.load(images_path, mmap_mode='r+')
+    for offset, path in enumerate(paths):
+        images[start + offset] = decode_image(path, size)
+    images.flush()
+    return len(paths)
+
+
+def pack_split(split_dir: str, directory: str, size: int = SHARD_SIZE, workers: Optional[int] = None,
+               chunk: int = 256, force: bool = False) -> Dict[str, Any]:
+    """Pack a split into shards, skipping the work if they already match its manifest"""
+    manifest = ensure_manifest(split_dir)
+    if not force and shards_current(directory, manifest, size):
+        return load_shard_meta(directory)
+
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, META_NAME)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    files = manifest['files']
+    paths = [os.path.join(split_dir, path) for path in files['path']]
+    count = len(paths)
+
+    # Build into temporary files and rename at the end, so readers never map a half-written shard
+    images_tmp = os.path.join(directory, f'{IMAGES_NAME}.tmp.npy')
+    labels_tmp = os.path.join(directory, f'{LABELS_NAME}.tmp.npy')
+    np.lib.format.open_memmap(images_tmp, mode='w+', dtype=np.uint8, shape=(count, size, size, 3)).flush()
+    np.save(labels_tmp, np.asarray(files['label'], dtype=np.int64))
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = [executor.submit(_pack_chunk, images_tmp, paths[start:start + chunk], start, size)
+                for start in range(0, count, chunk)]
+        with tqdm(total=count, desc=f'Packing {os.path.basename(split_dir)}') as progress:
+            for job in jobs:
+                progress.update(job.result())
+
+    os.replace(images_tmp, os.path.join(directory, IMAGES_NAME))
+    os.replace(labels_tmp, os.path.join(directory, LABELS_NAME))
+    meta = {
+        'classes': manifest['classes'],
+        'size': size,
+        'count': count,
+        'manifest_digest': manifest_digest(manifest)
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=4)
+    return meta
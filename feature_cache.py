@@ -0,0 +1,111 @@
+"""Cached backbone features for head-only retraining.
+
+The frozen ResNet50 backbone is run over a split once and its pooled 2048-d
+features are stored as memory-mapped float16 arrays:
+
+    data/features/<split>/features.npy   N x 2048 float16
+    data/features/<split>/labels.npy     N int64
+    data/features/<split>/features.json  backbone and dataset signatures, classes
+
+The cache is keyed by a hash of the backbone weights and by the dataset's
+signature (its manifest digest and how it is decoded), so changing either
+the images or the backbone re-extracts automatically.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+from tqdm import tqdm
+
+FEATURE_ROOT = 'data/features'
+FEATURES_NAME = 'features.npy'
+LABELS_NAME = 'labels.npy'
+META_NAME = 'features.json'
+
+
+def feature_dir(split: str, root: str = FEATURE_ROOT) -> str:
+    return os.path.join(root, split)
+
+
+def backbone_of(resnet: nn.Module) -> nn.Module:
+    """Everything up to and including global pooling, flattened to N x 2048"""
+    return nn.Sequential(*list(resnet.children())[:-1], nn.Flatten(1))
+
+
+def backbone_signature(backbone: nn.Module) -> str:
+    """Hash of the backbone's weights and buffers"""
+    digest = hashlib.sha256()
+    for name, tensor in backbone.state_dict().items():
+        digest.update(name.encode('utf-8'))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def load_feature_meta(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, META_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def extract_features(backbone: nn.Module, loader: Any, directory: str, device: torch.device,
+                     signature: Dict[str, str], classes: Any) -> Dict[str, Any]:
+    """Run the backbone over a loader (in order) and store its features, unless the cache is current"""
+    meta = load_feature_meta(directory)
+    if meta is not None and meta.get('signature') == signature \
+            and os.path.exists(os.path.join(directory, FEATURES_NAME)):
+        return meta
+
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, META_NAME)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    count = len(loader.dataset)
+    features_tmp = os.path.join(directory, f'{FEATURES_NAME}.tmp.npy')
+    features = np.lib.format.open_memmap(features_tmp, mode='w+', dtype=np.float16, shape=(count, 2048))
+    labels = np.empty(count, dtype=np.int64)
+
+    backbone = backbone.to(device).eval()
+    start = 0
+    with torch.no_grad():
+        for inputs, batch_labels in tqdm(loader, desc=f'Extracting features ({os.path.basename(directory)})'):
+            outputs = backbone(inputs.to(device))
+            end = start + outputs.size(0)
+            features[start:end] = outputs.to(torch.float16).cpu().numpy()
+            labels[start:end] = batch_labels.numpy()
+            start = end
+    features.flush()
+    del features
+
+    os.replace(features_tmp, os.path.join(directory, FEATURES_NAME))
+    np.save(os.path.join(directory, LABELS_NAME), labels)
+    meta = {'signature': signature, 'classes': list(classes), 'count': count, 'dim': 2048}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=4)
+    return meta
+
+
+class FeatureSet:
+    """Cached features of one split, iterated in (optionally shuffled) float32 batches"""
+
+    def __init__(self, directory: str):
+        self.features = np.load(os.path.join(directory, FEATURES_NAME), mmap_mode='r')
+        self.labels = torch.from_numpy(np.load(os.path.join(directory, LABELS_NAME)))
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def batches(self, batch_size: int, shuffle: bool = False,
+                generator: Optional[torch.Generator] = None) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        order = torch.randperm(len(self), generator=generator) if shuffle else torch.arange(len(self))
+        for start in range(0, len(self), batch_size):
+            index = order[start:start + batch_size]
+            # Sorted indices keep memmap reads sequential; the labels follow the same order
+            index, _ = index.sort()
+            features = torch.from_numpy(self.features[index.numpy()]).float()
+            yield features, self.labels[index]
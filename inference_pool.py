@@ -0,0 +1,287 @@
+import atexit
+import itertools
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from ai_model import BatchPreprocessor, CropDiseaseModel, build_network
+
+logger = logging.getLogger(__name__)
+
+# Prefer tmpfs so the exported weights file lives in shared memory
+SHARED_WEIGHTS_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def _available_cores() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _load_worker_network(weights_path: str, num_classes: int) -> torch.nn.Module:
+    """Load the network inside a worker without materializing a private copy of the weights"""
+    # mmap'd weights are backed by the page cache, shared by every worker
+    state_dict = torch.load(weights_path, map_location='cpu', mmap=True, weights_only=True)
+    with torch.device('meta'):
+        network = build_network(num_classes)
+    network.load_state_dict(state_dict, assign=True)
+    network.eval()
+    return network
+
+
+def _worker_main(worker_index: int, weights_path: str, num_classes: int, cores: List[int],
+                 num_threads: int, requests: Any, results: Any) -> None:
+    """Inference worker: pinned to `cores`, answers (job_id, uint8 NHWC batch) requests"""
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+    try:
+        network = _load_worker_network(weights_path, num_classes)
+    except Exception:
+        # Report instead of dying silently, so the parent doesn't wait out its start timeout
+        results.put(('failed', worker_index, traceback.format_exc()))
+        return
+    preprocessor = BatchPreprocessor()
+    results.put(('ready', worker_index, None))
+
+    while True:
+        job = requests.get()
+        if job is None:
+            return
+        job_id, batch = job
+        # Lets the parent fail just this job, not every pending one, if this worker dies
+        results.put(('taken', job_id, worker_index))
+        try:
+            with torch.inference_mode():
+                outputs = network(preprocessor(list(batch)))
+                probabilities = torch.softmax(outputs, dim=1).numpy()
+            results.put(('result', job_id, probabilities))
+        except Exception as e:
+            results.put(('error', job_id, f"{type(e).__name__}: {e}"))
+
+
+class InferencePool:
+    """Multi-process CropDiseaseModel inference that shares one copy of the weights.
+
+    Eager weights are exported once to a file in /dev/shm and every worker
+    mmaps it, so memory doesn't grow with the worker count. Only the eager
+    backend can be pooled: torch.jit.load has no mmap mode, so every worker
+    would hold a private copy of a TorchScript/int8 artifact. Workers are pinned to disjoint core sets with a matching
+    torch.set_num_threads, pull chunks from one shared queue, and a collector
+    thread resolves the callers' futures.
+    """
+
+    def __init__(self, model: CropDiseaseModel, workers: Optional[int] = None,
+                 threads_per_worker: Optional[int] = None, start_timeout: float = 120.0,
+                 result_timeout: Optional[float] = 60.0):
+        if model.network is None:
+            raise ValueError('InferencePool needs a model loaded from a checkpoint')
+        if model.backend != 'eager':
+            raise ValueError(f'InferencePool only shares eager weights, not the {model.backend} backend')
+
+        cores = _available_cores()
+        if workers is None:
+            workers = max(1, len(cores) // (threads_per_worker or 4))
+        if threads_per_worker is None:
+            threads_per_worker = max(1, len(cores) // workers)
+        self.model = model
+        self.result_timeout = result_timeout
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.core_sets = [[cores[(i * threads_per_worker + j) % len(cores)] for j in range(threads_per_worker)]
+                          for i in range(workers)]
+
+        context = mp.get_context('spawn')
+        self._context = context
+        self._requests = context.Queue()
+        self._results = context.Queue()
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._closed = False
+        self._stopped = False
+        self._failed_workers: set = set()
+        # job id -> index of the worker computing it (collector thread only)
+        self._taken: Dict[int, int] = {}
+        self._processes: List[Any] = []
+        try:
+            self.weights_path = os.path.join(SHARED_WEIGHTS_DIR, f'crop-disease-{os.getpid()}-{id(self):x}.pt')
+            torch.save(model.network.state_dict(), self.weights_path)
+            for index in range(workers):
+                self._processes.append(self._start_worker(context, index))
+            self._wait_ready(start_timeout)
+        except BaseException:
+            self._abort_startup()
+            raise
+        self._collector = threading.Thread(target=self._collect, name='inference-pool-collector', daemon=True)
+        self._collector.start()
+        # Don't leave the shared weights file behind in /dev/shm
+        atexit.register(self.close)
+        logger.info(f"Started {workers} inference workers x {threads_per_worker} threads "
+                    f"(backend {model.backend}, weights {self.weights_path})")
+
+    def _wait_ready(self, start_timeout: float) -> None:
+        """Wait until every worker has loaded its weights, failing fast if one can't"""
+        deadline = time.monotonic() + start_timeout
+        ready = set()
+        while len(ready) < len(self._processes):
+            try:
+                kind, index, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if any(not process.is_alive() for process in self._processes):
+                    raise RuntimeError('Inference worker exited during startup')
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'Inference workers did not start within {start_timeout}s')
+                continue
+            if kind == 'failed':
+                raise RuntimeError(f'Inference worker failed to start:\n{payload}')
+            ready.add(index)
+
+    def _abort_startup(self) -> None:
+        """Stop the workers that did start and remove the shared weights after a failed startup"""
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self._requests.cancel_join_thread()
+        self._results.cancel_join_thread()
+        weights_path = getattr(self, 'weights_path', None)
+        if weights_path and os.path.exists(weights_path):
+            os.remove(weights_path)
+
+    def _start_worker(self, context: Any, index: int) -> Any:
+        process = context.Process(
+            target=_worker_main,
+            args=(index, self.weights_path, len(self.model.class_names),
+                  self.core_sets[index], self.threads_per_worker, self._requests, self._results),
+            name=f'inference-worker-{index}',
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def submit(self, arrays: List[np.ndarray]) -> 'Future[np.ndarray]':
+        """Queue a chunk of input-size uint8 HxWx3 arrays; the future yields N x num_classes probabilities"""
+        batch = np.stack([self.model.input_array(array) for array in arrays])
+        future: 'Future[np.ndarray]' = Future()
+        job_id = next(self._job_ids)
+        # Same lock as close(), so no job can be queued behind the stop sentinels
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError('InferencePool is closed')
+            self._pending[job_id] = future
+            self._requests.put((job_id, batch))
+        return future
+
+    def predict_batch(self, arrays: List[np.ndarray], chunk_size: int = 16) -> List[Dict[str, Any]]:
+        """Same contract as CropDiseaseModel.predict_batch, with chunks spread across workers"""
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        futures = [self.submit(arrays[start:start + chunk_size]) for start in range(0, len(arrays), chunk_size)]
+        results: List[Dict[str, Any]] = []
+        try:
+            for future in futures:
+                results.extend(self.model.format_result(row) for row in future.result(self.result_timeout))
+        finally:
+            for future in futures:
+                future.cancel()
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            in_flight = len(self._pending)
+        return {
+            'workers': self.workers,
+            'threads_per_worker': self.threads_per_worker,
+            'alive_workers': sum(process.is_alive() for process in self._processes),
+            'in_flight': in_flight,
+            'backend': self.model.backend
+        }
+
+    def _collect(self) -> None:
+        # Keeps running while close() waits for the workers, so their last results are delivered
+        last_check = time.monotonic()
+        while not self._stopped:
+            if time.monotonic() - last_check >= 1.0:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                kind, job_id, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if kind == 'ready':
+                continue
+            if kind == 'taken':
+                self._taken[job_id] = payload
+                continue
+            if kind == 'failed':
+                # A restarted worker that can't load its weights would fail again; leave it down
+                logger.error(f"Inference worker {job_id} failed to restart:\n{payload}")
+                self._failed_workers.add(job_id)
+                continue
+            self._taken.pop(job_id, None)
+            with self._pending_lock:
+                future = self._pending.pop(job_id, None)
+            if future is None or not future.set_running_or_notify_cancel():
+                continue
+            if kind == 'result':
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _check_workers(self) -> None:
+        """Restart dead workers and fail the jobs they were computing; queued jobs go to the others"""
+        dead = [index for index, process in enumerate(self._processes)
+                if not process.is_alive() and index not in self._failed_workers]
+        if not dead or self._closed:
+            return
+        logger.error(f"Inference workers {dead} died, restarting them")
+        # Not requeued: a batch that crashed its worker would likely crash the next one too
+        lost = [job_id for job_id, index in self._taken.items() if index in dead]
+        for job_id in lost:
+            del self._taken[job_id]
+            with self._pending_lock:
+                future = self._pending.pop(job_id, None)
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError('Inference worker died'))
+        for index in dead:
+            self._processes[index] = self._start_worker(self._context, index)
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Let workers finish queued jobs, then stop them, fail whatever is left and remove the shared weights"""
+        with self._pending_lock:
+            if self._closed:
+                return
+            self._closed = True
+            for _ in self._processes:
+                self._requests.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._stopped = True
+        atexit.unregister(self.close)
+        self._collector.join(timeout)
+
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError('InferencePool was closed before answering'))
+        # Jobs nobody will read must not block interpreter exit in the queue's feeder thread
+        self._requests.cancel_join_thread()
+        if os.path.exists(self.weights_path):
+            os.remove(self.weights_path)
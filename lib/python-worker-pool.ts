@@ -0,0 +1,182 @@
+// Pool of long-running Python inference workers speaking newline-delimited JSON
+// (see worker_server.py). Each worker keeps its interpreter, torch import and
+// model loaded, so requests no longer pay a process spawn per upload. A worker
+// announces itself with a {"ready": true} line once the model is loaded; request
+// timeouts only start counting from then, startup has its own, longer timeout.
+// A worker whose request times out is killed and replaced.
+
+import { spawn, ChildProcessWithoutNullStreams } from "child_process"
+
+export type WorkerRequest = {
+  image_path?: string
+  image_base64?: string
+}
+
+type Pending = {
+  resolve: (value: any) => void
+  reject: (reason: Error) => void
+  timer?: ReturnType<typeof setTimeout>
+}
+
+type Worker = {
+  process: ChildProcessWithoutNullStreams
+  pending: Map<string, Pending>
+  buffer: string
+  ready: boolean
+  failed: boolean
+  startupTimer?: ReturnType<typeof setTimeout>
+}
+
+export type WorkerPoolOptions = {
+  command?: string
+  args: string[]
+  size?: number
+  timeoutMs?: number
+  startupTimeoutMs?: number
+}
+
+export class PythonWorkerPool {
+  private workers: Worker[] = []
+  private nextId = 0
+  private readonly command: string
+  private readonly args: string[]
+  private readonly size: number
+  private readonly timeoutMs: number
+  private readonly startupTimeoutMs: number
+
+  constructor({ command = "python", args, size = 2, timeoutMs = 30000, startupTimeoutMs = 180000 }: WorkerPoolOptions) {
+    this.command = command
+    this.args = args
+    this.size = size
+    this.timeoutMs = timeoutMs
+    this.startupTimeoutMs = startupTimeoutMs
+  }
+
+  private startWorker(): Worker {
+    const child = spawn(this.command, this.args)
+    const worker: Worker = { process: child, pending: new Map(), buffer: "", ready: false, failed: false }
+
+    // Covers the torch import and model load, which the per-request timeout doesn't
+    worker.startupTimer = setTimeout(() => {
+      this.failWorker(worker, new Error("Python worker did not become ready in time"))
+    }, this.startupTimeoutMs)
+
+    child.stdout.on("data", (data) => {
+      worker.buffer += data.toString()
+      let newline = worker.buffer.indexOf("\n")
+      while (newline !== -1) {
+        const line = worker.buffer.slice(0, newline).trim()
+        worker.buffer = worker.buffer.slice(newline + 1)
+        if (line) this.handleResponse(worker, line)
+        newline = worker.buffer.indexOf("\n")
+      }
+    })
+
+    child.stderr.on("data", (data) => {
+      console.error(`Python worker: ${data}`)
+    })
+
+    child.on("exit", (code) => {
+      this.failWorker(worker, new Error(`Python worker exited with code ${code}`))
+    })
+
+    // Unhandled "error" events would crash the server: spawn failures (e.g. a
+    // missing PYTHON_BIN) arrive on the child, writes to a dead worker (EPIPE) on stdin
+    child.on("error", (error) => {
+      this.failWorker(worker, new Error(`Python worker failed: ${error.message}`))
+    })
+    child.stdin.on("error", (error) => {
+      this.failWorker(worker, new Error(`Python worker stdin failed: ${error.message}`))
+    })
+
+    this.workers.push(worker)
+    return worker
+  }
+
+  private failWorker(worker: Worker, error: Error) {
+    // Fail everything still waiting on this worker; a replacement starts on demand
+    this.workers = this.workers.filter((w) => w !== worker)
+    clearTimeout(worker.startupTimer)
+    worker.pending.forEach((pending) => {
+      clearTimeout(pending.timer)
+      pending.reject(error)
+    })
+    worker.pending.clear()
+    if (!worker.failed) {
+      worker.failed = true
+      worker.process.kill()
+    }
+  }
+
+  private startTimer(worker: Worker, id: string, pending: Pending) {
+    // A worker handles one request at a time, so a request that times out is
+    // still occupying it: kill the worker (failing the requests queued behind
+    // it too) and let a fresh one start, instead of routing more work to it
+    pending.timer = setTimeout(() => {
+      this.failWorker(worker, new Error("Python worker timed out"))
+    }, this.timeoutMs)
+  }
+
+  private handleResponse(worker: Worker, line: string) {
+    let response: { id?: string; result?: any; error?: string; ready?: boolean }
+    try {
+      response = JSON.parse(line)
+    } catch (e) {
+      console.error("Failed to parse Python worker output:", line)
+      return
+    }
+    if (response.ready) {
+      // Requests queued during startup start their timeouts now
+      worker.ready = true
+      clearTimeout(worker.startupTimer)
+      worker.pending.forEach((pending, id) => this.startTimer(worker, id, pending))
+      return
+    }
+    const pending = response.id !== undefined ? worker.pending.get(String(response.id)) : undefined
+    if (!pending) return
+    worker.pending.delete(String(response.id))
+    clearTimeout(pending.timer)
+    if (response.error) {
+      pending.reject(new Error(response.error))
+    } else {
+      pending.resolve(response.result)
+    }
+  }
+
+  private pickWorker(): Worker {
+    if (this.workers.length < this.size) {
+      return this.startWorker()
+    }
+    // Least outstanding requests first
+    return this.workers.reduce((best, w) => (w.pending.size < best.pending.size ? w : best))
+  }
+
+  request<T = any>(payload: WorkerRequest): Promise<T> {
+    const worker = this.pickWorker()
+    const id = String(++this.nextId)
+
+    return new Promise<T>((resolve, reject) => {
+      const pending: Pending = { resolve, reject }
+      worker.pending.set(id, pending)
+      if (worker.ready) this.startTimer(worker, id, pending)
+      // Write failures are reported through the stdin "error" listener
+      worker.process.stdin.write(JSON.stringify({ id, ...payload }) + "\n")
+    })
+  }
+}
+
+// Shared pools, created lazily and kept across requests by the Node.js server
+const pools = new Map<string, PythonWorkerPool>()
+
+export function getWorkerPool(script: string): PythonWorkerPool {
+  let pool = pools.get(script)
+  if (!pool) {
+    pool = new PythonWorkerPool({
+      command: process.env.PYTHON_BIN || "python",
+      args: [script, "--serve"],
+      size: Number(process.env.PYTHON_WORKERS || 2),
+    })
+    pools.set(script, pool)
+  }
+  return pool
+}
@@ -1,7 +1,11 @@
+import os
 import sys
 import json
 from PIL import Image  # type: ignore
 
+# worker_server lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 # Dummy disease information for testing
 DISEASE_INFO = {
     "healthy": {
@@ -77,9 +81,24 @@ def predict_disease(image_path):
     
     return DISEASE_INFO[selected_disease]
 
+def handle_request(request):
+    """Handle one persistent-worker request"""
+    from worker_server import request_image_source
+    result = predict_disease(request_image_source(request))
+    if result is None:
+        raise ValueError("Failed to process image")
+    return result
+
 def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "--serve":
+        # Long-running mode: python detect_disease.py --serve [--socket PATH]
+        from worker_server import serve
+        socket_path = sys.argv[3] if len(sys.argv) == 4 and sys.argv[2] == "--socket" else None
+        serve(handle_request, socket_path)
+        return
+
     if len(sys.argv) != 2:
-        print("Usage: python detect_disease.py <image_path>")
+        print("Usage: python detect_disease.py <image_path> | --serve [--socket PATH]")
         sys.exit(1)
     
     image_path = sys.argv[1]
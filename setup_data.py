@@ -1,9 +1,19 @@
+import argparse
+import errno
+import hashlib
+import json
 import os
 import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import random
 from tqdm import tqdm
 
+from dataset_manifest import build_manifest, ensure_manifest, image_dimensions, is_image_file
+from dataset_shards import pack_split, shard_dir
+
 def create_directory_structure():
     """Create the necessary directories for training data."""
     base_dirs = ['data/train', 'data/val']
@@ -29,83 +39,361 @@ def create_directory_structure():
         for category in disease_categories:
             Path(os.path.join(base_dir, category)).mkdir(parents=True, exist_ok=True)
 
-def split_dataset(source_dir, train_dir, val_dir, split_ratio=0.8):
-    """Split the dataset into training and validation sets."""
-    for category in os.listdir(source_dir):
-        category_dir = os.path.join(source_dir, category)
-        if not os.path.isdir(category_dir):
+SPLIT_STATE_PATH = 'data/split_state.json'
+
+# Linux ioctl that clones a file's extents (btrfs, XFS, ...) without copying data
+FICLONE = 0x40049409
+
+class FileTransfer:
+    """Place source files into the splits by hardlink, reflink or copy.
+
+    'link' tries a hardlink, then a reflink, then a copy; 'reflink' skips
+    the hardlink; 'copy' always copies. A method that fails because the
+    filesystem doesn't support it (e.g. across devices) is not retried for
+    the rest of the run.
+    """
+    UNSUPPORTED = (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EMLINK)
+
+    def __init__(self, method='link'):
+        if method not in ('link', 'reflink', 'copy'):
+            raise ValueError(f'Unknown transfer method: {method}')
+        self.use_link = method == 'link'
+        self.use_reflink = method in ('link', 'reflink') and sys.platform.startswith('linux')
+        self.counts = {'linked': 0, 'reflinked': 0, 'copied': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, kind):
+        with self._lock:
+            self.counts[kind] += 1
+
+    def _reflink(self, src, dst):
+        import fcntl
+        with open(src, 'rb') as source, open(dst, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        shutil.copystat(src, dst)
+
+    def place(self, src, dst):
+        """Make dst a hardlink, reflink or copy of src, replacing any existing file."""
+        if os.path.lexists(dst):
+            os.remove(dst)
+        if self.use_link:
+            try:
+                os.link(src, dst)
+                self._count('linked')
+                return
+            except OSError as e:
+                if e.errno not in self.UNSUPPORTED:
+                    raise
+                self.use_link = False
+        if self.use_reflink:
+            try:
+                self._reflink(src, dst)
+                self._count('reflinked')
+                return
+            except (OSError, ImportError) as e:
+                if os.path.exists(dst):
+                    os.remove(dst)
+                if isinstance(e, OSError) and e.errno not in self.UNSUPPORTED:
+                    raise
+                self.use_reflink = False
+        shutil.copy2(src, dst)
+        self._count('copied')
+
+def load_split_state(path=SPLIT_STATE_PATH):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_split_state(state, path=SPLIT_STATE_PATH):
+    # Write then rename so an interrupted run never leaves a truncated state file
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def state_digest(state):
+    """Digest identifying a split state, used to tie data_info.json to the state it was counted from."""
+    return hashlib.sha256(json.dumps(state or {}, sort_keys=True).encode('utf-8')).hexdigest()
+
+def split_rank(seed, category, name):
+    """Seeded, stable pseudo-random rank of an image within its class."""
+    return hashlib.sha256(f'{seed}/{category}/{name}'.encode('utf-8')).hexdigest()
+
+def scan_source(source_dir):
+    """Map 'category/name' to (size, mtime_ns) for every source image."""
+    sources = {}
+    with os.scandir(source_dir) as categories:
+        for category in categories:
+            if not category.is_dir():
+                continue
+            with os.scandir(category.path) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_image_file(entry.name):
+                        stat = entry.stat()
+                        sources[f'{category.name}/{entry.name}'] = (stat.st_size, stat.st_mtime_ns)
+    return sources
+
+def plan_split(sources, previous, split_ratio, seed):
+    """Assign every source image to 'train' or 'val'.
+
+    Images already placed by an earlier run with the same seed and ratio
+    keep their split; new images of a class are ranked by a seeded hash and
+    fill whichever split is short of the ratio, so a first run behaves like
+    a seeded shuffle and later runs never move existing images.
+    """
+    by_category = {}
+    for key in sources:
+        by_category.setdefault(key.split('/', 1)[0], []).append(key)
+
+    assignments = {}
+    for category, keys in by_category.items():
+        kept = [key for key in keys if key in previous]
+        new = sorted((key for key in keys if key not in previous),
+                     key=lambda key: split_rank(seed, category, key.split('/', 1)[1]))
+        kept_train = sum(previous[key]['split'] == 'train' for key in kept)
+        for key in kept:
+            assignments[key] = previous[key]['split']
+        train_count = min(len(new), max(0, int(len(keys) * split_ratio) - kept_train))
+        for index, key in enumerate(new):
+            assignments[key] = 'train' if index < train_count else 'val'
+    return assignments
+
+def image_record(entry):
+    """The size/width/height part of a split state entry."""
+    return {'size': entry['size'], 'width': entry.get('width'), 'height': entry.get('height')}
+
+def split_dataset(source_dir, train_dir, val_dir, split_ratio=0.8, seed=None, method='link', workers=None,
+                  state_path=SPLIT_STATE_PATH):
+    """Split the dataset into training and validation sets.
+
+    Images are placed with hardlinks or reflinks where the filesystem allows
+    it and copied otherwise, in parallel. The split is deterministic for a
+    given seed, and incremental: the state file records every placed image,
+    so re-running only places new or changed images and removes images that
+    disappeared from the source. Image dimensions are read from the header
+    of each placed image only. Returns the change log, a list of
+    (action, split, 'category/name', record) tuples with action 'add' or
+    'remove' and record the image's size, width and height. The new state
+    records the digest of the state the change log starts from.
+    """
+    split_dirs = {'train': train_dir, 'val': val_dir}
+    state = load_split_state(state_path) or {}
+    if seed is None:
+        seed = state.get('seed', random.randrange(2 ** 32))
+    previous = state.get('files', {})
+    if state and (state.get('seed') != seed or state.get('split_ratio') != split_ratio):
+        print('Seed or split ratio changed, re-planning the whole split')
+        previous_plan = {}
+    else:
+        previous_plan = previous
+
+    sources = scan_source(source_dir)
+    assignments = plan_split(sources, previous_plan, split_ratio, seed)
+
+    # Work out what has to be placed or removed
+    changes = []
+    for key, (size, mtime_ns) in sources.items():
+        split = assignments[key]
+        old = previous.get(key)
+        if old is not None and old['split'] == split and old['size'] == size and old['mtime_ns'] == mtime_ns \
+                and os.path.exists(os.path.join(split_dirs[split], key)):
             continue
-            
-        # Get all images in the category
-        images = [f for f in os.listdir(category_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        random.shuffle(images)
-        
-        # Calculate split point
-        split_point = int(len(images) * split_ratio)
-        
-        # Split into train and val
-        train_images = images[:split_point]
-        val_images = images[split_point:]
-        
-        # Copy files to respective directories
-        for img in tqdm(train_images, desc=f"Copying {category} to train"):
-            src = os.path.join(category_dir, img)
-            dst = os.path.join(train_dir, category, img)
-            shutil.copy2(src, dst)
-            
-        for img in tqdm(val_images, desc=f"Copying {category} to val"):
-            src = os.path.join(category_dir, img)
-            dst = os.path.join(val_dir, category, img)
-            shutil.copy2(src, dst)
-
-def create_data_info():
-    """Create a JSON file with information about the dataset."""
-    import json
-    
-    data_info = {
+        if old is not None:
+            # The image leaves its old split (changed file or re-planned split)
+            changes.append(('remove', old['split'], key, image_record(old)))
+        changes.append(('add', split, key, {'size': size, 'width': None, 'height': None}))
+    for key, old in previous.items():
+        if key not in sources:
+            changes.append(('remove', old['split'], key, image_record(old)))
+
+    transfer = FileTransfer(method)
+
+    def apply(change):
+        action, split, key, record = change
+        path = os.path.join(split_dirs[split], key)
+        if action == 'remove':
+            if os.path.lexists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        source = os.path.join(source_dir, key)
+        transfer.place(source, path)
+        try:
+            record['width'], record['height'] = image_dimensions(source)
+        except OSError:
+            pass
+
+    # Removals first, then link/copy in parallel; these calls release the GIL
+    for change in changes:
+        if change[0] == 'remove':
+            apply(change)
+    additions = [change for change in changes if change[0] == 'add']
+    with ThreadPoolExecutor(max_workers=workers or min(32, 4 * (os.cpu_count() or 1))) as executor:
+        list(tqdm(executor.map(apply, additions), total=len(additions), desc='Placing images'))
+
+    # Dimensions of unchanged images carry over from the previous state
+    placed = {key: record for _, _, key, record in additions}
+    files = {}
+    for key, (size, mtime_ns) in sources.items():
+        record = placed.get(key) or image_record(previous[key])
+        files[key] = dict(record, split=assignments[key], mtime_ns=mtime_ns)
+    save_split_state({
+        'seed': seed,
+        'split_ratio': split_ratio,
+        'files': files,
+        'previous_digest': state_digest(state)
+    }, state_path)
+    unchanged = len(sources) - len(additions)
+    print(f"{len(additions)} images placed ({transfer.counts['linked']} hardlinked, "
+          f"{transfer.counts['reflinked']} reflinked, {transfer.counts['copied']} copied), "
+          f"{len(changes) - len(additions)} removed, {unchanged} unchanged")
+    return changes
+
+def create_manifests():
+    """Build or incrementally update the manifest of each split for CropDiseaseDataset."""
+    for split in ['train', 'val']:
+        manifest = build_manifest(f'data/{split}')
+        print(f"{split}: {len(manifest['files']['path'])} images in {len(manifest['classes'])} classes")
+
+def create_shards():
+    """Pack each split into memory-mapped uint8 shards for ShardDataset."""
+    for split in ['train', 'val']:
+        meta = pack_split(f'data/{split}', shard_dir(split))
+        print(f"{split}: {meta['count']} images packed at {meta['size']}x{meta['size']}")
+
+DATA_INFO_PATH = 'data_info.json'
+DATA_INFO_VERSION = 2
+
+# Upper bounds of the short-side resolution buckets in the histograms
+RESOLUTION_BUCKETS = (128, 256, 512, 1024, 2048, 4096)
+
+def resolution_bucket(width, height):
+    """Histogram bucket for an image, by its shorter side."""
+    if not width or not height:
+        return 'unknown'
+    short_side = min(width, height)
+    lower = 0
+    for upper in RESOLUTION_BUCKETS:
+        if short_side < upper:
+            return f'{lower}-{upper - 1}'
+        lower = upper
+    return f'{lower}+'
+
+def empty_data_info():
+    return {
+        'version': DATA_INFO_VERSION,
         'diseases': {},
         'total_images': 0,
         'train_images': 0,
-        'val_images': 0
+        'val_images': 0,
+        'total_bytes': 0
     }
-    
-    for split in ['train', 'val']:
-        split_dir = f'data/{split}'
-        for category in os.listdir(split_dir):
-            category_dir = os.path.join(split_dir, category)
-            if not os.path.isdir(category_dir):
-                continue
-                
-            num_images = len([f for f in os.listdir(category_dir) 
-                            if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-            
-            if category not in data_info['diseases']:
-                data_info['diseases'][category] = {
-                    'total': 0,
-                    'train': 0,
-                    'val': 0
-                }
-            
-            data_info['diseases'][category][split] = num_images
-            data_info['diseases'][category]['total'] += num_images
-            data_info[f'{split}_images'] += num_images
-            data_info['total_images'] += num_images
-    
-    with open('data_info.json', 'w') as f:
+
+def count_image(data_info, split, category, record, sign=1):
+    """Add (sign=1) or subtract (sign=-1) one image in the statistics."""
+    disease = data_info['diseases'].setdefault(category, {
+        'total': 0,
+        'train': 0,
+        'val': 0,
+        'bytes': {'total': 0, 'train': 0, 'val': 0},
+        'resolutions': {'train': {}, 'val': {}}
+    })
+    disease[split] += sign
+    disease['total'] += sign
+    disease['bytes'][split] += sign * record['size']
+    disease['bytes']['total'] += sign * record['size']
+    histogram = disease['resolutions'][split]
+    bucket = resolution_bucket(record.get('width'), record.get('height'))
+    histogram[bucket] = histogram.get(bucket, 0) + sign
+    if not histogram[bucket]:
+        del histogram[bucket]
+    data_info[f'{split}_images'] += sign
+    data_info['total_images'] += sign
+    data_info['total_bytes'] += sign * record['size']
+
+def load_data_info(path=DATA_INFO_PATH):
+    try:
+        with open(path, 'r') as f:
+            data_info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data_info if data_info.get('version') == DATA_INFO_VERSION else None
+
+def create_data_info(changes=None, path=DATA_INFO_PATH, state_path=SPLIT_STATE_PATH):
+    """Create or update a JSON file with information about the dataset.
+
+    With the change log from split_dataset, the existing file is updated in
+    place, but only if it was counted from the state the change log starts
+    from; otherwise (e.g. an earlier run stopped between the split and this
+    step, or there is no current file) it is rebuilt from the split state,
+    which already holds every image's size and dimensions, or from the split
+    manifests when the data wasn't split by this script. Besides image
+    counts it records per-class byte sizes and short-side resolution
+    histograms.
+    """
+    data_info = load_data_info(path)
+    state = load_split_state(state_path)
+    if changes is not None and data_info is not None and state is not None \
+            and data_info.get('split_state') == state.get('previous_digest'):
+        for action, split, key, record in changes:
+            count_image(data_info, split, key.split('/', 1)[0], record, 1 if action == 'add' else -1)
+    else:
+        if changes is not None and data_info is not None:
+            print('data_info.json does not match the split state, rebuilding it')
+        data_info = empty_data_info()
+        if state is not None:
+            for key, entry in state['files'].items():
+                count_image(data_info, entry['split'], key.split('/', 1)[0], entry)
+        else:
+            for split in ['train', 'val']:
+                files = ensure_manifest(f'data/{split}')['files']
+                for key, size, width, height in zip(files['path'], files['size'], files['width'], files['height']):
+                    count_image(data_info, split, key.split('/', 1)[0],
+                                {'size': size, 'width': width, 'height': height})
+    data_info['split_state'] = state_digest(state) if state is not None else None
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
         json.dump(data_info, f, indent=4)
+    os.replace(tmp_path, path)
+    return data_info
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Split the source images and prepare the training data')
+    parser.add_argument('--source', default='source_images', help='Directory with one subdirectory per class')
+    parser.add_argument('--split-ratio', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, help='Seed for a reproducible split (default: the previous run\'s)')
+    parser.add_argument('--method', choices=['link', 'reflink', 'copy'], default='link',
+                        help='Hardlink, then reflink, then copy (link); reflink, then copy (reflink); or always copy')
+    parser.add_argument('--workers', type=int, help='Parallel link/copy threads')
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+
     # Create directory structure
     print("Creating directory structure...")
     create_directory_structure()
     
     # Split dataset (assuming source images are in 'source_images' directory)
     print("\nSplitting dataset...")
-    split_dataset('source_images', 'data/train', 'data/val')
+    changes = split_dataset(args.source, 'data/train', 'data/val', split_ratio=args.split_ratio, seed=args.seed,
+                            method=args.method, workers=args.workers)
+    
+    # Index the splits so training doesn't rescan them
+    print("\nCreating dataset manifests...")
+    create_manifests()
+    
+    # Pre-decode the splits so training doesn't decode JPEGs every epoch
+    print("\nPacking training shards...")
+    create_shards()
     
-    # Create dataset information
+    # Update dataset information from the split's change log
     print("\nCreating dataset information...")
-    create_data_info()
+    create_data_info(changes)
     
     print("\nDataset setup complete!")
 
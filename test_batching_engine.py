@@ -0,0 +1,110 @@
+"""BatchingEngine tests against a fake model (no checkpoint or torch forward passes)"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+import pytest
+
+from ai_model import BatchingEngine
+
+
+class FakeModel:
+    """Echoes each image's first pixel; `gate` holds batches back until it is set"""
+
+    def __init__(self):
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self.error = None
+
+    def predict_batch(self, arrays, chunk_size=16):
+        self.started.set()
+        self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        values = [int(array[0, 0, 0]) for array in arrays]
+        self.batches.append(values)
+        return [{'value': value} for value in values]
+
+
+class FakeRegistry:
+    def __init__(self, model):
+        self.model = model
+
+    def get(self):
+        return self.model
+
+
+def image(value):
+    return np.full((2, 2, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+
+@pytest.fixture
+def engine(model):
+    engine = BatchingEngine(FakeRegistry(model), max_batch_size=4, max_wait_ms=20)
+    engine.start()
+    yield engine
+    model.gate.set()
+    engine.stop(timeout=5)
+
+
+def test_each_caller_gets_its_own_result(engine, model):
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda value: engine.predict(image(value), timeout=5), range(40)))
+    assert [result['value'] for result in results] == list(range(40))
+    assert all(len(batch) <= 4 for batch in model.batches)
+    assert sum(len(batch) for batch in model.batches) == 40
+
+
+def test_requests_queued_behind_a_busy_worker_share_a_batch(engine, model):
+    model.gate.clear()
+    first = engine.submit(image(0))
+    assert model.started.wait(5)
+    queued = [engine.submit(image(value)) for value in range(1, 5)]
+    model.gate.set()
+    assert first.result(5) == {'value': 0}
+    assert [future.result(5)['value'] for future in queued] == [1, 2, 3, 4]
+    assert model.batches == [[0], [1, 2, 3, 4]]
+    assert engine.stats()['max_batch_size_seen'] == 4
+
+
+def test_timed_out_request_is_not_inferred(engine, model):
+    model.gate.clear()
+    engine.submit(image(0))
+    assert model.started.wait(5)
+    with pytest.raises(FutureTimeoutError):
+        engine.predict(image(1), timeout=0.05)
+    model.gate.set()
+    engine.predict(image(2), timeout=5)
+    assert [value for batch in model.batches for value in batch] == [0, 2]
+
+
+def test_model_errors_fail_the_whole_batch(engine, model):
+    model.gate.clear()
+    engine.submit(image(0))  # occupies the worker
+    assert model.started.wait(5)
+    model.error = RuntimeError('boom')
+    futures = [engine.submit(image(value)) for value in range(3)]
+    model.gate.set()
+    for future in futures:
+        with pytest.raises(RuntimeError, match='boom'):
+            future.result(5)
+    assert engine.stats()['errors'] >= 1
+
+
+def test_stop_finishes_queued_requests(model):
+    engine = BatchingEngine(FakeRegistry(model), max_batch_size=2, max_wait_ms=1)
+    futures = [engine.submit(image(value)) for value in range(5)]
+    engine.stop(timeout=5)
+    assert [future.result(0)['value'] for future in futures] == list(range(5))
+
+
+def test_max_batch_size_must_be_positive():
+    with pytest.raises(ValueError):
+        BatchingEngine(FakeRegistry(FakeModel()), max_batch_size=0)
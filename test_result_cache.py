@@ -0,0 +1,46 @@
+"""ResultCache keying and tier tests"""
+from cache import ResultCache
+
+
+def test_key_depends_on_bytes_version_and_options():
+    key = ResultCache.key(b'image', 'v1', {'resize': [160, 160]})
+    assert key == ResultCache.key(b'image', 'v1', {'resize': [160, 160]})
+    assert key != ResultCache.key(b'other', 'v1', {'resize': [160, 160]})
+    assert key != ResultCache.key(b'image', 'v2', {'resize': [160, 160]})
+    assert key != ResultCache.key(b'image', 'v1', {'resize': [128, 128]})
+    assert key != ResultCache.key(b'image', 'v1')
+
+
+def test_key_ignores_option_order_and_treats_none_as_empty():
+    assert (ResultCache.key(b'image', 'v1', {'enhance': True, 'resize': [160, 160]})
+            == ResultCache.key(b'image', 'v1', {'resize': [160, 160], 'enhance': True}))
+    assert ResultCache.key(b'image', 'v1', None) == ResultCache.key(b'image', 'v1', {})
+
+
+def test_key_fields_do_not_run_together():
+    assert ResultCache.key(b'ab', 'c') != ResultCache.key(b'a', 'bc')
+
+
+def test_memory_tier_counts_hits_and_misses():
+    cache = ResultCache(max_size=2)
+    key = ResultCache.key(b'image', 'v1')
+    assert cache.get(key) is None
+    cache.set(key, {'disease': 'rust'})
+    assert cache.get(key) == {'disease': 'rust'}
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['misses']) == (1, 1)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_disk_tier_survives_a_new_instance_and_clear_drops_it(tmp_path):
+    key = ResultCache.key(b'image', 'v1')
+    ResultCache(disk_dir=str(tmp_path)).set(key, {'disease': 'rust'})
+
+    cache = ResultCache(disk_dir=str(tmp_path))
+    assert cache.get(key) == {'disease': 'rust'}
+    assert cache.get(key) == {'disease': 'rust'}
+    assert (cache.stats()['disk_hits'], cache.stats()['memory_hits']) == (1, 1)
+
+    cache.clear()
+    assert cache.get(key) is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,85 @@
+"""Tests for the deterministic split plan and the incremental dataset statistics"""
+import os
+
+import pytest
+from PIL import Image
+
+from setup_data import create_data_info, plan_split, split_dataset
+
+
+def make_sources(counts):
+    return {f'{category}/{index}.jpg': (100, 0) for category, count in counts.items() for index in range(count)}
+
+
+def test_plan_split_is_deterministic_for_a_seed():
+    sources = make_sources({'healthy': 20, 'rust': 7})
+    plan = plan_split(sources, {}, 0.8, seed=42)
+    assert plan == plan_split(dict(reversed(list(sources.items()))), {}, 0.8, seed=42)
+    assert plan != plan_split(sources, {}, 0.8, seed=43)
+    assert sum(split == 'train' for key, split in plan.items() if key.startswith('healthy/')) == 16
+    assert sum(split == 'train' for key, split in plan.items() if key.startswith('rust/')) == 5
+
+
+def test_plan_split_keeps_previous_assignments():
+    sources = make_sources({'healthy': 10})
+    plan = plan_split(sources, {}, 0.8, seed=1)
+    previous = {key: {'split': split} for key, split in plan.items()}
+    sources.update(make_sources({'healthy': 15}))
+    grown = plan_split(sources, previous, 0.8, seed=1)
+    assert all(grown[key] == split for key, split in plan.items())
+    assert sum(split == 'train' for split in grown.values()) == 12
+
+
+def write_image(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', size).save(path)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    source = tmp_path / 'source'
+    for index in range(6):
+        write_image(str(source / 'healthy' / f'{index}.png'), (64 + index, 300))
+    for index in range(4):
+        write_image(str(source / 'rust' / f'{index}.png'), (600, 600))
+    paths = {
+        'source': str(source),
+        'train': str(tmp_path / 'train'),
+        'val': str(tmp_path / 'val'),
+        'state': str(tmp_path / 'split_state.json'),
+        'info': str(tmp_path / 'data_info.json')
+    }
+
+    def split():
+        return split_dataset(paths['source'], paths['train'], paths['val'], seed=7,
+                             state_path=paths['state'], method='copy')
+
+    def data_info(changes=None):
+        return create_data_info(changes, path=paths['info'], state_path=paths['state'])
+
+    return source, split, data_info
+
+
+
+
+def test_incremental_data_info_matches_a_full_rebuild(dataset):
+    source, split, data_info = dataset
+    data_info(split())
+
+    os.remove(source / 'healthy' / '0.png')
+    write_image(str(source / 'healthy' / '1.png'), (2000, 1500))
+    write_image(str(source / 'blight' / '0.png'), (100, 100))
+    incremental = data_info(split())
+    assert incremental['total_images'] == 10
+    assert incremental == data_info()
+
+
+def test_data_info_is_rebuilt_when_a_run_stopped_after_the_split(dataset):
+    source, split, data_info = dataset
+    data_info(split())
+
+    write_image(str(source / 'blight' / '0.png'), (100, 100))
+    split()  # stopped before create_data_info
+    info = data_info(split())
+    assert info['total_images'] == 11
+    assert info == data_info()
@@ -0,0 +1,103 @@
+"""Offline tests for TokenCache with a stand-in issuer and a fake clock"""
+import pytest
+
+from cache import TokenCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StubIssuer:
+    """Verifies tokens of the form 'valid-<uid>', each expiring `lifetime` seconds after `clock`"""
+
+    def __init__(self, clock, lifetime=3600):
+        self.clock = clock
+        self.lifetime = lifetime
+        self.calls = []
+
+    def __call__(self, token):
+        self.calls.append(token)
+        if not token.startswith('valid-'):
+            raise ValueError('Invalid token')
+        return {'uid': token[len('valid-'):], 'exp': self.clock() + self.lifetime}
+
+
+def make_cache(max_size=1024, lifetime=3600):
+    clock = FakeClock()
+    issuer = StubIssuer(clock, lifetime)
+    return TokenCache(issuer, max_size=max_size, clock=clock), issuer, clock
+
+
+def test_repeat_hits_verify_once():
+    cache, issuer, _ = make_cache()
+    for _ in range(5):
+        assert cache.verify('valid-alice')['uid'] == 'alice'
+    assert issuer.calls == ['valid-alice']
+    assert cache.stats()['hits'] == 4
+    assert cache.stats()['misses'] == 1
+
+
+def test_entry_expires_at_exp_claim():
+    cache, issuer, clock = make_cache(lifetime=60)
+    cache.verify('valid-alice')
+    clock.now += 59.9
+    cache.verify('valid-alice')
+    assert len(issuer.calls) == 1
+    clock.now += 0.1
+    cache.verify('valid-alice')
+    assert len(issuer.calls) == 2
+
+
+def test_already_expired_token_is_not_cached():
+    cache, issuer, _ = make_cache(lifetime=0)
+    cache.verify('valid-alice')
+    cache.verify('valid-alice')
+    assert len(issuer.calls) == 2
+
+
+def test_rejected_tokens_are_not_cached():
+    cache, issuer, _ = make_cache()
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.verify('forged')
+    assert issuer.calls == ['forged', 'forged']
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_token_is_evicted():
+    cache, issuer, _ = make_cache(max_size=2)
+    cache.verify('valid-a')
+    cache.verify('valid-b')
+    cache.verify('valid-a')  # b is now least recently used
+    cache.verify('valid-c')
+    assert cache.stats()['size'] == 2
+    issuer.calls.clear()
+    cache.verify('valid-a')
+    cache.verify('valid-c')
+    assert issuer.calls == []
+    cache.verify('valid-b')
+    assert issuer.calls == ['valid-b']
+
+
+def test_returned_claims_do_not_alias_the_cache():
+    cache, _, _ = make_cache()
+    cache.verify('valid-alice')['uid'] = 'mallory'
+    assert cache.verify('valid-alice')['uid'] == 'alice'
+
+
+def test_verify_auth_header_uses_the_pluggable_verifier(monkeypatch):
+    import app
+    cache, issuer, _ = make_cache()
+    monkeypatch.setattr(app, 'token_cache', cache)
+    assert app.verify_auth_header('Bearer valid-alice')['uid'] == 'alice'
+    assert app.verify_auth_header('Bearer valid-alice')['uid'] == 'alice'
+    assert issuer.calls == ['valid-alice']
+    with pytest.raises(app.AuthError):
+        app.verify_auth_header('Bearer forged')
+    with pytest.raises(app.AuthError):
+        app.verify_auth_header(None)
@@ -4,26 +4,32 @@ import torch.optim as optim
 from torch.utils.data import Dataset, DataLoader
 from torchvision import transforms, models
 from PIL import Image
+import argparse
+import json
 import os
+import time
 import numpy as np
 from tqdm import tqdm
 
+from checkpoints import AsyncCheckpointer, load_checkpoint, restore_rng_state, rng_state
+from dataset_manifest import ensure_manifest, manifest_digest
+from dataset_shards import IMAGES_NAME, LABELS_NAME, load_shard_meta, shard_dir, shards_current
+from feature_cache import FeatureSet, backbone_of, backbone_signature, extract_features, feature_dir
+
 # Define the dataset class
 class CropDiseaseDataset(Dataset):
     def __init__(self, root_dir, transform=None):
         self.root_dir = root_dir
         self.transform = transform
-        self.classes = sorted(os.listdir(root_dir))
+        # Index from the split's manifest (see setup_data.py) instead of listing every directory
+        manifest = ensure_manifest(root_dir)
+        self.classes = manifest['classes']
         self.class_to_idx = {cls: idx for idx, cls in enumerate(self.classes)}
         
-        self.images = []
-        self.labels = []
-        
-        for cls in self.classes:
-            cls_dir = os.path.join(root_dir, cls)
-            for img_name in os.listdir(cls_dir):
-                self.images.append(os.path.join(cls_dir, img_name))
-                self.labels.append(self.class_to_idx[cls])
+        files = manifest['files']
+        self.images = [os.path.join(root_dir, path) for path in files['path']]
+        self.labels = list(files['label'])
+        self.sizes = list(zip(files['width'], files['height']))
 
     def __len__(self):
         return len(self.images)
@@ -38,6 +44,56 @@ class CropDiseaseDataset(Dataset):
 
         return image, label
 
+class ShardDataset(Dataset):
+    """Pre-decoded split packed by setup_data.py, read zero-copy from memory-mapped arrays"""
+    def __init__(self, shard_dir, transform=None):
+        self.shard_dir = shard_dir
+        self.transform = transform
+        meta = load_shard_meta(shard_dir)
+        if meta is None:
+            raise FileNotFoundError(f'No shards in {shard_dir}; run setup_data.py first')
+        self.classes = meta['classes']
+        self.class_to_idx = {cls: idx for idx, cls in enumerate(self.classes)}
+        self.size = meta['size']
+        self.labels = np.load(os.path.join(shard_dir, LABELS_NAME))
+        self.images = None
+
+    def _images(self):
+        # Mapped lazily so each DataLoader worker opens its own view of the shared pages;
+        # copy-on-write keeps tensors writable without copying the file
+        if self.images is None:
+            self.images = np.load(os.path.join(self.shard_dir, IMAGES_NAME), mmap_mode='c')
+        return self.images
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        # uint8 CHW view of the mapped HWC image
+        image = torch.from_numpy(self._images()[idx]).permute(2, 0, 1)
+        label = int(self.labels[idx])
+
+        if self.transform:
+            image = self.transform(image)
+
+        return image, label
+
+    def __getstate__(self):
+        # Don't pickle the mapping into DataLoader workers
+        state = self.__dict__.copy()
+        state['images'] = None
+        return state
+
+def load_split(split, transform, shard_transform):
+    """Use the packed shards for a split when they are current, otherwise decode the images"""
+    split_dir = os.path.join('data', split)
+    directory = shard_dir(split)
+    meta = load_shard_meta(directory)
+    if meta is not None and shards_current(directory, ensure_manifest(split_dir), meta['size']):
+        print(f'Using packed shards for {split}')
+        return ShardDataset(directory, transform=shard_transform)
+    return CropDiseaseDataset(split_dir, transform=transform)
+
 # Define the model class
 class CropDiseaseModel(nn.Module):
     def __init__(self, num_classes):
@@ -56,58 +112,372 @@ class CropDiseaseModel(nn.Module):
     def forward(self, x):
         return self.model(x)
 
-def train_model(model, train_loader, val_loader, criterion, optimizer, num_epochs, device):
+class Precision:
+    """Autocast dtype, loss scaler and memory format for the plain or fast mode.
+
+    The fast mode autocasts to bf16 on CPU and to fp16 with a GradScaler on
+    CUDA, and feeds channels_last tensors; the plain mode is fp32 throughout.
+    """
+    def __init__(self, device, fast=False):
+        self.fast = fast
+        self.device_type = device.type
+        self.dtype = torch.float16 if device.type == 'cuda' else torch.bfloat16
+        self.scaler = torch.amp.GradScaler(device.type, enabled=fast and device.type == 'cuda')
+        self.memory_format = torch.channels_last if fast else torch.contiguous_format
+
+    def autocast(self):
+        return torch.autocast(self.device_type, dtype=self.dtype, enabled=self.fast)
+
+class StepTimer:
+    """Per-step wall time split into loader wait, host-to-device copy, forward, backward and optimizer.
+
+    On CUDA each mark synchronizes the device so time lands in the stage
+    that spent it, which slows training down a little; it is opt-in.
+    """
+    STAGES = ('data', 'h2d', 'forward', 'backward', 'optimizer')
+
+    def __init__(self, device, enabled=True):
+        self.enabled = enabled
+        self.sync = device.type == 'cuda'
+        self.reset()
+
+    def reset(self):
+        self.totals = dict.fromkeys(self.STAGES, 0.0)
+        self.steps = 0
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        """Charge the time since the previous mark to `stage`"""
+        if not self.enabled:
+            return
+        if self.sync:
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        self.totals[stage] += now - self._last
+        self._last = now
+        if stage == self.STAGES[-1]:
+            self.steps += 1
+
+    def summary(self):
+        total = sum(self.totals.values())
+        if not self.steps or not total:
+            return 'no steps timed'
+        parts = [f'{stage} {1000 * seconds / self.steps:.1f}ms ({100 * seconds / total:.0f}%)'
+                 for stage, seconds in self.totals.items()]
+        bound = 'data-loading bound' if self.totals['data'] > total / 2 else 'compute bound'
+        return f"per step: {', '.join(parts)} -> {bound}"
+
+def train_step(model, inputs, labels, criterion, optimizer, precision, device, timer):
+    """One optimizer step; returns the detached loss, outputs and on-device labels"""
+    timer.mark('data')
+    non_blocking = device.type == 'cuda'
+    inputs = inputs.to(device, non_blocking=non_blocking, memory_format=precision.memory_format)
+    labels = labels.to(device, non_blocking=non_blocking)
+    timer.mark('h2d')
+
+    optimizer.zero_grad(set_to_none=True)
+    with precision.autocast():
+        outputs = model(inputs)
+        loss = criterion(outputs, labels)
+    timer.mark('forward')
+    precision.scaler.scale(loss).backward()
+    timer.mark('backward')
+    precision.scaler.step(optimizer)
+    precision.scaler.update()
+    timer.mark('optimizer')
+    return loss.detach(), outputs.detach(), labels
+
+def best_model_state(model, classes):
+    """best_model.pth contents: the weights plus the class name of each output index"""
+    return {'state_dict': model.state_dict(), 'classes': list(classes)}
+
+def train_model(model, train_loader, val_loader, criterion, optimizer, num_epochs, device, fast=False,
+                compile_model=False, timing=False, checkpointer=None, checkpoint_every=1, resume=None):
+    """Train and keep the best checkpoint by validation accuracy.
+
+    fast=True runs forward passes under autocast (bf16 on CPU, fp16 with a
+    GradScaler on CUDA) on channels_last inputs; compile_model wraps the
+    model in torch.compile; timing=True prints a per-stage step breakdown
+    each epoch. Loss and accuracy are accumulated on the device in both
+    modes and read back once per epoch instead of every step.
+
+    With a checkpointer, a full checkpoint is written in the background
+    every `checkpoint_every` epochs (and after the last one), as is
+    best_model.pth; `resume` is a loaded checkpoint to continue from.
+    """
     best_val_acc = 0.0
+    start_epoch = 0
+    precision = Precision(device, fast)
+    model = model.to(memory_format=precision.memory_format)
+    # Checkpoints come from the uncompiled module so their keys stay loadable by ai_model.py
+    network = model
+    if resume is not None:
+        network.load_state_dict(resume['model'])
+        optimizer.load_state_dict(resume['optimizer'])
+        if resume.get('scaler'):
+            precision.scaler.load_state_dict(resume['scaler'])
+        restore_rng_state(resume['rng'])
+        best_val_acc = resume['best_val_acc']
+        start_epoch = resume['epoch']
+        print(f'Resuming after epoch {start_epoch} (best validation accuracy {best_val_acc:.2f}%)')
+    if compile_model:
+        model = torch.compile(model)
+    non_blocking = device.type == 'cuda'
+    timer = StepTimer(device, enabled=timing)
     
-    for epoch in range(num_epochs):
+    for epoch in range(start_epoch, num_epochs):
         print(f'Epoch {epoch+1}/{num_epochs}')
         
         # Training phase
         model.train()
-        running_loss = 0.0
-        correct = 0
+        running_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.long, device=device)
         total = 0
+        start = time.perf_counter()
+        timer.reset()
         
         for inputs, labels in tqdm(train_loader):
-            inputs, labels = inputs.to(device), labels.to(device)
-            
-            optimizer.zero_grad()
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            
-            running_loss += loss.item()
-            _, predicted = torch.max(outputs.data, 1)
+            loss, outputs, labels = train_step(model, inputs, labels, criterion, optimizer, precision, device, timer)
+            running_loss += loss
+            correct += (outputs.argmax(1) == labels).sum()
             total += labels.size(0)
-            correct += (predicted == labels).sum().item()
         
-        train_acc = 100 * correct / total
-        print(f'Training Loss: {running_loss/len(train_loader):.4f}, Accuracy: {train_acc:.2f}%')
+        # One host sync per epoch
+        train_loss = running_loss.item() / len(train_loader)
+        train_acc = 100 * correct.item() / total
+        elapsed = time.perf_counter() - start
+        print(f'Training Loss: {train_loss:.4f}, Accuracy: {train_acc:.2f}%, '
+              f'{total / elapsed:.1f} images/sec')
+        if timing:
+            print(f'Step timing {timer.summary()}')
         
         # Validation phase
         model.eval()
-        val_correct = 0
+        val_correct = torch.zeros((), dtype=torch.long, device=device)
         val_total = 0
+        start = time.perf_counter()
         
-        with torch.no_grad():
+        with torch.no_grad(), precision.autocast():
             for inputs, labels in val_loader:
-                inputs, labels = inputs.to(device), labels.to(device)
+                inputs = inputs.to(device, non_blocking=non_blocking, memory_format=precision.memory_format)
+                labels = labels.to(device, non_blocking=non_blocking)
                 outputs = model(inputs)
-                _, predicted = torch.max(outputs.data, 1)
+                val_correct += (outputs.argmax(1) == labels).sum()
                 val_total += labels.size(0)
-                val_correct += (predicted == labels).sum().item()
         
-        val_acc = 100 * val_correct / val_total
-        print(f'Validation Accuracy: {val_acc:.2f}%')
+        val_acc = 100 * val_correct.item() / val_total
+        elapsed = time.perf_counter() - start
+        print(f'Validation Accuracy: {val_acc:.2f}%, {val_total / elapsed:.1f} images/sec')
         
         # Save the best model
         if val_acc > best_val_acc:
             best_val_acc = val_acc
-            torch.save(model.state_dict(), 'best_model.pth')
+            best_state = best_model_state(network, train_loader.dataset.classes)
+            if checkpointer is not None:
+                checkpointer.save(best_state, 'best_model.pth', prune=False)
+            else:
+                torch.save(best_state, 'best_model.pth')
+            print('Saved best model')
+        
+        # Full checkpoint to resume from
+        if checkpointer is not None and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == num_epochs):
+            checkpointer.save_checkpoint({
+                'epoch': epoch + 1,
+                'model': network.state_dict(),
+                'optimizer': optimizer.state_dict(),
+                'scaler': precision.scaler.state_dict(),
+                'best_val_acc': best_val_acc,
+                'rng': rng_state()
+            }, epoch + 1)
+    
+    if checkpointer is not None:
+        checkpointer.wait()
+
+def dataset_signature(split, dataset):
+    """Identifies the images of a split and how they are decoded, for the feature cache"""
+    digest = manifest_digest(ensure_manifest(os.path.join('data', split)))
+    return f'{type(dataset).__name__}:{dataset.transform!r}:{digest}'
+
+def train_head(model, train_dataset, val_dataset, loader_config, device, num_epochs, lr, batch_size=256):
+    """Retrain only the fc head on cached backbone features, then save the full model.
+
+    The frozen backbone runs over each split once; its pooled features are
+    cached under data/features and reused until the images, their
+    preprocessing or the backbone weights change.
+    """
+    resnet = model.model
+    backbone = backbone_of(resnet)
+    backbone_hash = backbone_signature(backbone)
+    feature_sets = {}
+    for split, dataset in (('train', train_dataset), ('val', val_dataset)):
+        signature = {'backbone': backbone_hash, 'dataset': dataset_signature(split, dataset)}
+        loader = make_loader(dataset, loader_config, shuffle=False)
+        extract_features(backbone, loader, feature_dir(split), device, signature, dataset.classes)
+        feature_sets[split] = FeatureSet(feature_dir(split))
+
+    head = resnet.fc.to(device)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(head.parameters(), lr=lr)
+    best_val_acc = 0.0
+
+    for epoch in range(num_epochs):
+        head.train()
+        running_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.long, device=device)
+        steps = 0
+        for features, labels in feature_sets['train'].batches(batch_size, shuffle=True):
+            features, labels = features.to(device), labels.to(device)
+            optimizer.zero_grad(set_to_none=True)
+            outputs = head(features)
+            loss = criterion(outputs, labels)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.detach()
+            correct += (outputs.argmax(1) == labels).sum()
+            steps += 1
+        train_acc = 100 * correct.item() / len(feature_sets['train'])
+
+        head.eval()
+        val_correct = torch.zeros((), dtype=torch.long, device=device)
+        with torch.no_grad():
+            for features, labels in feature_sets['val'].batches(batch_size):
+                outputs = head(features.to(device))
+                val_correct += (outputs.argmax(1) == labels.to(device)).sum()
+        val_acc = 100 * val_correct.item() / len(feature_sets['val'])
+        print(f'Epoch {epoch+1}/{num_epochs}: Training Loss: {running_loss.item() / max(steps, 1):.4f}, '
+              f'Accuracy: {train_acc:.2f}%, Validation Accuracy: {val_acc:.2f}%')
+
+        # The saved model is the frozen backbone plus the best head so far
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            torch.save(best_model_state(model, train_dataset.classes), 'best_model.pth')
             print('Saved best model')
 
+# DataLoader settings written by --autotune and picked up by later runs
+LOADER_CONFIG_PATH = 'dataloader_config.json'
+DEFAULT_LOADER_CONFIG = {
+    'batch_size': 32,
+    'num_workers': 4,
+    'pin_memory': False,
+    'persistent_workers': False,
+    'prefetch_factor': 2
+}
+
+def load_loader_config(device, path=LOADER_CONFIG_PATH):
+    config = dict(DEFAULT_LOADER_CONFIG, pin_memory=device.type == 'cuda')
+    try:
+        with open(path, 'r') as f:
+            config.update(json.load(f)['config'])
+    except (OSError, ValueError, KeyError):
+        pass
+    return config
+
+def make_loader(dataset, config, shuffle):
+    kwargs = {
+        'batch_size': config['batch_size'],
+        'shuffle': shuffle,
+        'num_workers': config['num_workers'],
+        'pin_memory': config['pin_memory']
+    }
+    # Only valid with worker processes
+    if config['num_workers'] > 0:
+        kwargs['persistent_workers'] = config['persistent_workers']
+        kwargs['prefetch_factor'] = config['prefetch_factor']
+    return DataLoader(dataset, **kwargs)
+
+def benchmark_loader(dataset, config, model, criterion, optimizer, precision, device, steps, passes=2):
+    """End-to-end training images/sec for a loader config over `passes` short epochs of `steps` batches"""
+    loader = make_loader(dataset, config, shuffle=True)
+    timer = StepTimer(device)
+    images = 0
+    start = time.perf_counter()
+    # Several passes so worker startup and persistent_workers are accounted for
+    for _ in range(passes):
+        for step, (inputs, labels) in enumerate(loader):
+            if step >= steps:
+                break
+            _, _, labels = train_step(model, inputs, labels, criterion, optimizer, precision, device, timer)
+            images += labels.size(0)
+    elapsed = time.perf_counter() - start
+    del loader
+    return images / elapsed, timer
+
+def autotune_loader(dataset, model, criterion, optimizer, device, fast=False, steps=10,
+                    path=LOADER_CONFIG_PATH):
+    """Coordinate search over DataLoader settings on the real dataset; writes the best to `path`.
+
+    Each setting is tuned in turn with the others held at their best value
+    so far, measuring real training steps, so the batch size is chosen for
+    the model's throughput and not only the loader's.
+    """
+    cpus = os.cpu_count() or 1
+    candidates = {
+        'num_workers': sorted({0, min(2, cpus), min(4, cpus), cpus}),
+        'batch_size': [16, 32, 64],
+        'prefetch_factor': [2, 4, 8],
+        'pin_memory': [False, True] if device.type == 'cuda' else [False],
+        'persistent_workers': [False, True]
+    }
+    precision = Precision(device, fast)
+    model = model.to(memory_format=precision.memory_format)
+    model.train()
+    best = dict(DEFAULT_LOADER_CONFIG, num_workers=min(DEFAULT_LOADER_CONFIG['num_workers'], cpus))
+    results = {}
+
+    def measure(config):
+        key = json.dumps(config, sort_keys=True)
+        if key not in results:
+            speed, timer = benchmark_loader(dataset, config, model, criterion, optimizer, precision, device, steps)
+            results[key] = speed
+            print(f'{config}: {speed:.1f} images/sec, {timer.summary()}')
+        return results[key]
+
+    for name, values in candidates.items():
+        if best['num_workers'] == 0 and name in ('prefetch_factor', 'persistent_workers'):
+            continue
+        best[name] = max(values, key=lambda value: measure(dict(best, **{name: value})))
+
+    report = {
+        'config': best,
+        'images_per_sec': results[json.dumps(best, sort_keys=True)],
+        'device': str(device),
+        'fast': fast,
+        'dataset_size': len(dataset),
+        'results': [dict(json.loads(key), images_per_sec=speed) for key, speed in results.items()]
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Best DataLoader config {best}: {report['images_per_sec']:.1f} images/sec (saved to {path})")
+    return best
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train the crop disease classifier')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, help=f'Default: from {LOADER_CONFIG_PATH}, else 32')
+    parser.add_argument('--num-workers', type=int, help=f'Default: from {LOADER_CONFIG_PATH}, else 4')
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--fast', action='store_true',
+                        help='Mixed precision (bf16 on CPU, fp16 AMP on CUDA) with channels_last tensors')
+    parser.add_argument('--compile', action='store_true', help='Wrap the model in torch.compile')
+    parser.add_argument('--timing', action='store_true',
+                        help='Print per-step loader wait / H2D / forward / backward / optimizer times')
+    parser.add_argument('--head-only', action='store_true',
+                        help='Train only the classifier head on cached backbone features')
+    parser.add_argument('--head-batch-size', type=int, default=256)
+    parser.add_argument('--backbone-from', help='Checkpoint to take the backbone weights from (its head is ignored)')
+    parser.add_argument('--checkpoint-dir', default='checkpoints')
+    parser.add_argument('--checkpoint-every', type=int, default=1, help='Epochs between full checkpoints')
+    parser.add_argument('--keep-checkpoints', type=int, default=3, help='Number of full checkpoints to keep')
+    parser.add_argument('--resume', nargs='?', const='latest',
+                        help='Continue from a checkpoint file, or the newest one in --checkpoint-dir')
+    parser.add_argument('--autotune', action='store_true',
+                        help=f'Benchmark DataLoader settings on the training set and write {LOADER_CONFIG_PATH}')
+    parser.add_argument('--autotune-steps', type=int, default=10, help='Training steps timed per setting and pass')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+
     # Set device
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     print(f'Using device: {device}')
@@ -120,24 +490,74 @@ def main():
                           std=[0.229, 0.224, 0.225])
     ])
 
-    # Create datasets
-    train_dataset = CropDiseaseDataset('data/train', transform=transform)
-    val_dataset = CropDiseaseDataset('data/val', transform=transform)
+    # Same preprocessing for pre-decoded uint8 tensors from the shards
+    shard_transform = transforms.Compose([
+        transforms.Resize((224, 224), antialias=True),
+        transforms.ConvertImageDtype(torch.float),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406],
+                          std=[0.229, 0.224, 0.225])
+    ])
 
-    # Create data loaders
-    train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, num_workers=4)
-    val_loader = DataLoader(val_dataset, batch_size=32, shuffle=False, num_workers=4)
+    # Create datasets
+    train_dataset = load_split('train', transform, shard_transform)
+    val_dataset = load_split('val', transform, shard_transform)
 
     # Initialize model
     num_classes = len(train_dataset.classes)
     model = CropDiseaseModel(num_classes).to(device)
+    if args.backbone_from:
+        # The head may have a different number of classes, so only the backbone is loaded
+        state_dict = torch.load(args.backbone_from, map_location=device, weights_only=True)
+        # best_model.pth files wrap the weights with their class list; older ones are bare state dicts
+        state_dict = state_dict.get('state_dict', state_dict)
+        backbone_state = {key: value for key, value in state_dict.items() if not key.startswith('model.fc.')}
+        model.load_state_dict(backbone_state, strict=False)
+        print(f'Loaded backbone weights from {args.backbone_from}')
+    if args.fast:
+        model = model.to(memory_format=torch.channels_last)
 
     # Define loss function and optimizer
     criterion = nn.CrossEntropyLoss()
-    optimizer = optim.Adam(model.parameters(), lr=0.001)
+    optimizer = optim.Adam(model.parameters(), lr=args.lr)
+
+    if args.autotune:
+        autotune_loader(train_dataset, model, criterion, optimizer, device, fast=args.fast, steps=args.autotune_steps)
+        return
+
+    # Create data loaders (tuned settings from --autotune, command-line overrides)
+    loader_config = load_loader_config(device)
+    if args.batch_size is not None:
+        loader_config['batch_size'] = args.batch_size
+    if args.num_workers is not None:
+        loader_config['num_workers'] = args.num_workers
+    print(f'DataLoader config: {loader_config}')
+
+    if args.head_only:
+        train_head(model, train_dataset, val_dataset, loader_config, device, num_epochs=args.epochs, lr=args.lr,
+                   batch_size=args.head_batch_size)
+        return
+
+    train_loader = make_loader(train_dataset, loader_config, shuffle=True)
+    val_loader = make_loader(val_dataset, loader_config, shuffle=False)
+
+    # Resume from a checkpoint if asked
+    checkpointer = AsyncCheckpointer(args.checkpoint_dir, keep=args.keep_checkpoints)
+    resume = None
+    if args.resume:
+        path = checkpointer.latest() if args.resume == 'latest' else args.resume
+        if path is None:
+            print(f'No checkpoint in {args.checkpoint_dir}, starting from scratch')
+        else:
+            print(f'Loading checkpoint {path}')
+            resume = load_checkpoint(path)
 
     # Train the model
-    train_model(model, train_loader, val_loader, criterion, optimizer, num_epochs=10, device=device)
+    try:
+        train_model(model, train_loader, val_loader, criterion, optimizer, num_epochs=args.epochs, device=device,
+                    fast=args.fast, compile_model=args.compile, timing=args.timing, checkpointer=checkpointer,
+                    checkpoint_every=args.checkpoint_every, resume=resume)
+    finally:
+        checkpointer.close()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""Newline-delimited JSON request loop for long-running inference workers.
+
+Each request is one JSON object per line:
+
+    {"id": "42", "image_path": "/tmp/leaf.jpg"}
+    {"id": "43", "image_base64": "<base64 or data URL>"}
+
+and each response echoes the id with either a result or an error:
+
+    {"id": "42", "result": {...}}
+    {"id": "43", "error": "..."}
+
+On stdin/stdout the worker first writes {"ready": true} once it is able to
+answer. Workers read requests from stdin (responses on stdout) or from a Unix
+socket, so one process keeps its interpreter, imports and model warm
+across requests instead of being spawned per upload.
+"""
+import base64
+import io
+import json
+import os
+import socketserver
+import sys
+from typing import Any, Callable, Dict, IO, Optional, Union
+
+Handler = Callable[[Dict[str, Any]], Any]
+
+
+def request_image_source(request: Dict[str, Any]) -> Union[str, io.BytesIO]:
+    """Return the image path, or a file-like object for base64 payloads"""
+    if request.get('image_path'):
+        return request['image_path']
+    if request.get('image_base64'):
+        data = request['image_base64']
+        if data.startswith('data:image'):
+            data = data.split(',', 1)[1]
+        return io.BytesIO(base64.b64decode(data))
+    raise ValueError('Request needs image_path or image_base64')
+
+
+def handle_line(line: str, handler: Handler) -> Optional[Dict[str, Any]]:
+    """Run one request line through the handler and build its response"""
+    line = line.strip()
+    if not line:
+        return None
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        return {'id': request_id, 'result': handler(request)}
+    except Exception as e:
+        return {'id': request_id, 'error': str(e)}
+
+
+def serve_stream(handler: Handler, infile: IO[str] = sys.stdin, outfile: IO[str] = sys.stdout) -> None:
+    """Answer requests from infile until EOF, one response line per request.
+
+    A {"ready": true} line goes out first, so the parent can tell startup
+    (imports, model load) apart from request handling.
+    """
+    outfile.write(json.dumps({'ready': True}) + '\n')
+    outfile.flush()
+    for line in infile:
+        response = handle_line(line, handler)
+        if response is not None:
+            outfile.write(json.dumps(response) + '\n')
+            outfile.flush()
+
+
+def serve_socket(handler: Handler, socket_path: str) -> None:
+    """Answer requests on a Unix socket, one thread per connection"""
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            for raw_line in self.rfile:
+                response = handle_line(raw_line.decode('utf-8'), handler)
+                if response is not None:
+                    self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+                    self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(socket_path)
+
+
+def serve(handler: Handler, socket_path: Optional[str] = None) -> None:
+    """Serve on a Unix socket if a path is given, otherwise on stdin/stdout"""
+    if socket_path:
+        serve_socket(handler, socket_path)
+    else:
+        # Anything else printing to stdout would corrupt the protocol
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            serve_stream(handler, sys.stdin, stdout)
+        finally:
+            sys.stdout = stdout
+